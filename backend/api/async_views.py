@@ -0,0 +1,258 @@
+"""
+Асинхронные обработчики чтения для ASGI (uvicorn).
+
+Список и карточка рецепта, лента подписок, теги, поиск ингредиентов
+и подписки отдаются корутинами. Django 3.2 не умеет асинхронно
+ни ORM, ни кэш, поэтому работа с БД идёт через sync_to_async в потоке запроса
+(thread_sensitive: foodgram.asgi даёт каждому запросу свой поток),
+а чтение кэша — в общем пуле потоков, одновременно с запросами к БД
+(asyncio.gather). Ответ из кэша собирается в цикле событий без
+перехода в поток БД.
+
+POST, PATCH, DELETE и прочие методы, а также запросы других форматов
+(например, HTML браузера) выполняют прежние синхронные вьюсеты DRF.
+Маршруты подключаются в api/urls.py при ASYNC_VIEWS.
+"""
+import asyncio
+from functools import partial, wraps
+
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpResponse
+from django.utils.cache import patch_vary_headers
+from rest_framework import exceptions
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.views import exception_handler
+
+from api import cache as recipe_cache
+from api.mixins import not_modified, set_validator_headers, validator_headers
+from api.relations import get_relations
+from api.serializers import RecipeReadSerializer, SubscribeSerializer
+from api.views import (IngredientViewSet, RecipeViewSet, TagViewSet,
+                       UserViewSet, recipe_validators)
+from recipes.timeline import Timeline
+
+database = partial(sync_to_async, thread_sensitive=True)
+cache_io = partial(sync_to_async, thread_sensitive=False)
+
+
+def json_response(data, status=200):
+    return HttpResponse(
+        JSONRenderer().render(data), status=status,
+        content_type=JSONRenderer.media_type,
+    )
+
+
+def authenticate(request):
+    """Проверить токен; DRF запоминает пользователя на запросе."""
+    return request.user
+
+
+def error_response(request, exc):
+    """Ответ на исключение, как в APIView.handle_exception."""
+    if isinstance(exc, (exceptions.NotAuthenticated,
+                        exceptions.AuthenticationFailed)):
+        header = (
+            request.authenticators
+            and request.authenticators[0].authenticate_header(request)
+        )
+        if header:
+            exc.auth_header = header
+        else:
+            exc.status_code = 403
+    response = exception_handler(exc, {'request': request})
+    if response is None:
+        raise exc
+    result = json_response(response.data, response.status_code)
+    for name, value in response.items():
+        if name.lower() != 'content-type':
+            result[name] = value
+    return result
+
+
+def accepts_json(request):
+    """
+    Согласование содержимого DRF (?format= и Accept) выбирает JSON.
+    Обработчики ниже умеют отдавать только его.
+    """
+    renderers = [
+        renderer() for renderer in api_settings.DEFAULT_RENDERER_CLASSES
+    ]
+    try:
+        renderer, _ = DefaultContentNegotiation().select_renderer(
+            Request(request), renderers
+        )
+    except (exceptions.NotAcceptable, Http404):
+        return False
+    return renderer.format == 'json'
+
+
+def read_view(fallback):
+    """
+    Асинхронное представление для GET и HEAD в JSON. Остальные методы
+    и форматы передаются синхронному представлению fallback.
+    """
+    def decorator(handler):
+        @wraps(handler)
+        async def view(request, *args, **kwargs):
+            if (request.method not in ('GET', 'HEAD')
+                    or not accepts_json(request)):
+                return await database(fallback)(request, *args, **kwargs)
+            request = Request(request, authenticators=[
+                auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES
+            ])
+            try:
+                await database(authenticate)(request)
+                response = await handler(request, *args, **kwargs)
+            except Exception as exc:
+                response = await database(error_response)(request, exc)
+            patch_vary_headers(response, ('Accept', 'Authorization'))
+            return response
+
+        # csrf_exempt() обернул бы корутину в синхронную функцию.
+        view.csrf_exempt = True
+        return view
+    return decorator
+
+
+def make_view(viewset, request, action, **kwargs):
+    """Экземпляр вьюсета для действия, как его готовит as_view()."""
+    view = viewset(**getattr(getattr(viewset, action), 'kwargs', {}))
+    view.action = action
+    view.action_map = {'get': action}
+    view.request = request
+    view.args = ()
+    view.kwargs = kwargs
+    view.format_kwarg = None
+    view.check_permissions(request)
+    return view
+
+
+async def conditional(request, validators, build):
+    """ConditionalGetMixin для корутин: build() вызывается при промахе."""
+    etag, timestamp = validator_headers(*validators, 'json')
+    response = not_modified(request, etag, timestamp)
+    if response is None:
+        response = json_response(await build())
+    set_validator_headers(response, etag, timestamp)
+    return response
+
+
+def load_relations(request):
+    """Загрузить все связи пользователя, пока ждём кэш."""
+    relations = get_relations(request)
+    return relations.followed_ids, relations.favorite_ids, relations.cart_ids
+
+
+async def represent(serializer, recipes, cached):
+    """Рецепты из кэша собираются на месте, промахи — в потоке БД."""
+    if all(recipe.pk in cached[0] for recipe in recipes):
+        return serializer.to_representation_many(recipes, cached)
+    return await database(serializer.to_representation_many)(
+        recipes, cached
+    )
+
+
+def list_data(view):
+    queryset = view.filter_queryset(view.get_queryset())
+    return view.get_serializer(queryset, many=True).data
+
+
+@read_view(TagViewSet.as_view({'get': 'list', 'post': 'create'}))
+async def tag_list(request):
+    view = make_view(TagViewSet, request, 'list')
+    return await conditional(
+        request, await database(view.get_list_validators)(),
+        partial(database(list_data), view),
+    )
+
+
+@read_view(IngredientViewSet.as_view({'get': 'list', 'post': 'create'}))
+async def ingredient_list(request):
+    view = make_view(IngredientViewSet, request, 'list')
+
+    async def build():
+        return (await database(view.search)(request)).data
+
+    return await conditional(
+        request, await database(view.get_list_validators)(), build
+    )
+
+
+def recipe_page(view):
+    queryset = view.filter_queryset(view.get_queryset())
+    page = view.paginate_queryset(queryset)
+    return list(queryset) if page is None else page
+
+
+async def recipe_page_response(request, view, get_page):
+    """Страница рецептов: кэш и связи читаются одновременно."""
+    serializer = RecipeReadSerializer(context=view.get_serializer_context())
+    recipes = await database(get_page)(view)
+    cached, _ = await asyncio.gather(
+        cache_io(recipe_cache.lookup)(
+            [recipe.pk for recipe in recipes], serializer.get_cache_host()
+        ),
+        database(load_relations)(request),
+    )
+    data = await represent(serializer, recipes, cached)
+    if view.paginator is None:
+        return json_response(data)
+    return json_response(view.get_paginated_response(data).data)
+
+
+@read_view(RecipeViewSet.as_view({'get': 'list', 'post': 'create'}))
+async def recipe_list(request):
+    view = make_view(RecipeViewSet, request, 'list')
+    return await recipe_page_response(request, view, recipe_page)
+
+
+def feed_page(view):
+    return view.paginate_queryset(Timeline(view.request.user))
+
+
+@read_view(RecipeViewSet.as_view({'get': 'feed'}))
+async def recipe_feed(request):
+    view = make_view(RecipeViewSet, request, 'feed')
+    return await recipe_page_response(request, view, feed_page)
+
+
+@read_view(RecipeViewSet.as_view({
+    'get': 'retrieve',
+    'put': 'update',
+    'patch': 'partial_update',
+    'delete': 'destroy',
+}))
+async def recipe_detail(request, pk):
+    view = make_view(RecipeViewSet, request, 'retrieve', pk=pk)
+    serializer = RecipeReadSerializer(context=view.get_serializer_context())
+    recipe, cached, version, _ = await asyncio.gather(
+        database(view.get_object)(),
+        cache_io(recipe_cache.lookup)([pk], serializer.get_cache_host()),
+        cache_io(recipe_cache.get_version)(pk),
+        database(load_relations)(request),
+    )
+
+    async def build():
+        return (await represent(serializer, [recipe], cached))[0]
+
+    return await conditional(request, recipe_validators(
+        recipe, request.user, get_relations(request), version,
+    ), build)
+
+
+def subscriptions_page(view):
+    authors = view.paginate_queryset(view.subscribed_authors())
+    serializer = SubscribeSerializer(
+        view.with_subscription_data(authors), many=True,
+        context={'request': view.request},
+    )
+    return view.get_paginated_response(serializer.data).data
+
+
+@read_view(UserViewSet.as_view({'get': 'subscriptions'}))
+async def subscriptions(request):
+    view = make_view(UserViewSet, request, 'subscriptions')
+    return json_response(await database(subscriptions_page)(view))
@@ -0,0 +1,95 @@
+"""
+Кэш общей, не зависящей от пользователя, части представления рецепта.
+
+Ключ данных включает версию рецепта и версию справочников (теги,
+ингредиенты). При изменении данных версия увеличивается, и старые
+записи просто перестают читаться, а затем вытесняются по таймауту.
+Ключи версий лежат в том же вытесняемом кэше, поэтому отсчёт версии
+начинается не с нуля, а с текущего времени в наносекундах: вытесненная
+версия создаётся заново со значением, которого ещё не было, и данные
+под прежними версиями не читаются.
+Используются только get_many/set_many/incr/add, поэтому кэш работает
+и с locmem, и с Redis-совместимыми бэкендами.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from api import metrics
+
+RECIPE_VERSION_KEY = 'recipe:{}:version'
+CATALOGUE_VERSION_KEY = 'recipe:catalogue:version'
+RECIPE_DATA_KEY = 'recipe:{}:{}:v{}.{}'
+
+
+def bump_version(key):
+    """Увеличить счётчик версии, создав его при отсутствии."""
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, time.time_ns(), timeout=None):
+            cache.incr(key)
+
+
+def get_versions(keys):
+    """
+    Текущие версии; отсутствующие создаются одной пачкой и перечитываются:
+    если параллельный запрос записал свою версию позже, берётся она.
+    """
+    versions = cache.get_many(keys)
+    version = time.time_ns()
+    missing = {key: version for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        versions.update(missing)
+        versions.update(cache.get_many(list(missing)))
+    return versions
+
+
+def lookup(recipe_ids, host):
+    """
+    Найти закэшированные представления рецептов.
+    Возвращает найденные данные и ключи, под которыми следует
+    сохранить недостающие.
+    """
+    version_keys = [RECIPE_VERSION_KEY.format(pk) for pk in recipe_ids]
+    versions = get_versions(version_keys + [CATALOGUE_VERSION_KEY])
+    keys = {
+        pk: RECIPE_DATA_KEY.format(
+            host, pk, versions[version_key], versions[CATALOGUE_VERSION_KEY]
+        )
+        for pk, version_key in zip(recipe_ids, version_keys)
+    }
+    found = cache.get_many(list(keys.values()))
+    hits = {pk: found[key] for pk, key in keys.items() if key in found}
+    metrics.cache_result(
+        'recipe', hits=len(hits), misses=len(keys) - len(hits)
+    )
+    return hits, keys
+
+
+def get_version(recipe_id):
+    """Текущая версия закэшированного представления рецепта."""
+    version_key = RECIPE_VERSION_KEY.format(recipe_id)
+    versions = get_versions([version_key, CATALOGUE_VERSION_KEY])
+    return '{}.{}'.format(
+        versions[version_key], versions[CATALOGUE_VERSION_KEY]
+    )
+
+
+def store(keys, data):
+    """Сохранить представления рецептов под ключами из lookup()."""
+    cache.set_many(
+        {keys[pk]: value for pk, value in data.items()},
+        timeout=settings.RECIPE_CACHE_TIMEOUT,
+    )
+
+
+def invalidate_recipes(recipe_ids):
+    for pk in recipe_ids:
+        bump_version(RECIPE_VERSION_KEY.format(pk))
+
+
+def invalidate_catalogue():
+    bump_version(CATALOGUE_VERSION_KEY)
@@ -1,16 +1,18 @@
 from django.contrib.auth import get_user_model
 from django_filters import rest_framework as filters
 
+from recipes.index import ingredient_index
 from recipes.models import Recipe, Tag
 
 User = get_user_model()
 
 
 class IngredientFilter(filters.FilterSet):
-    name = filters.CharFilter(
-        field_name='name',
-        lookup_expr='icontains'
-    )
+    """Поиск ингредиентов по индексу в памяти: префикс, затем подстрока."""
+    name = filters.CharFilter(method='filter_name')
+
+    def filter_name(self, queryset, name, value):
+        return queryset.filter(id__in=ingredient_index.search_ids(value))
 
 
 class RecipeFilter(filters.FilterSet):
@@ -27,10 +29,14 @@ class RecipeFilter(filters.FilterSet):
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart',
         label='shopping_cart',)
+    search = filters.CharFilter(
+        method='filter_search',
+        label='search',)
 
     class Meta:
         model = Recipe
-        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart')
+        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart',
+                  'search')
 
     def filter_is_favorited(self, queryset, name, value):
         if value and self.request.user.is_authenticated:
@@ -41,3 +47,11 @@ class RecipeFilter(filters.FilterSet):
         if value and self.request.user.is_authenticated:
             return queryset.filter(shopping_cart__user=self.request.user)
         return queryset
+
+    def filter_search(self, queryset, name, value):
+        """Поиск по названию и описанию, сначала самые релевантные."""
+        if not value.strip():
+            return queryset
+        return queryset.search(value).order_by(
+            '-search_rank', '-pub_date', '-id'
+        )
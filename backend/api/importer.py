@@ -0,0 +1,158 @@
+"""
+Массовый импорт рецептов.
+
+Рецепты обрабатываются пачками. Каждый рецепт проверяется
+сериализатором без обращений к БД, затем все упомянутые в пачке
+теги и ингредиенты проверяются двумя запросами IN, и корректные
+рецепты вставляются через bulk_create вместе со связями в одной
+транзакции. bulk_create обходит сигналы, поэтому счётчик рецептов
+автора, построение копий изображений и раздача в ленты подписчиков
+запускаются явно.
+"""
+from django.db import transaction
+
+from api.serializers import RecipeImportSerializer
+from recipes import counters, tasks
+from recipes.loaders import batched
+from recipes.models import Ingredient, IngredientRecipe, Recipe, Tag
+from users.models import User
+
+BATCH_SIZE = 500
+
+
+def insert_recipes(recipes):
+    """
+    Вставить рецепты и проставить им id. SQLite в Django 3.2
+    не возвращает id из bulk_create. Пока транзакция пишет, база
+    заблокирована для других писателей, а AUTOINCREMENT выдаёт id
+    по возрастанию, поэтому вставленные строки — последние по id.
+    """
+    Recipe.objects.bulk_create(recipes)
+    if recipes[0].pk is not None:
+        return
+    ids = sorted(
+        Recipe.objects.order_by('-pk').values_list(
+            'pk', flat=True
+        )[:len(recipes)]
+    )
+    for recipe, pk in zip(recipes, ids):
+        recipe.pk = pk
+
+
+class RecipeImporter:
+    """
+    Импорт рецептов одного автора. run() принимает любой итератор
+    словарей и возвращает отчёт: id созданных рецептов и ошибки
+    с номером рецепта во входных данных.
+    """
+
+    def __init__(self, author, batch_size=BATCH_SIZE):
+        self.author = author
+        self.batch_size = batch_size
+        self.total = 0
+        self.created_ids = []
+        self.errors = []
+
+    def run(self, items, on_batch=None):
+        for batch in batched(items, self.batch_size):
+            self.import_batch(batch)
+            if on_batch:
+                on_batch(self.report())
+        return self.report()
+
+    def report(self):
+        return {
+            'total': self.total,
+            'created': len(self.created_ids),
+            'ids': self.created_ids,
+            'errors': sorted(self.errors, key=lambda error: error['index']),
+        }
+
+    def import_batch(self, batch):
+        valid = []
+        for index, item in enumerate(batch, start=self.total):
+            if not isinstance(item, dict):
+                self.errors.append({'index': index, 'errors': {
+                    'non_field_errors': ['Ожидается объект рецепта'],
+                }})
+                continue
+            serializer = RecipeImportSerializer(data=item)
+            if serializer.is_valid():
+                valid.append((index, serializer.validated_data))
+            else:
+                self.errors.append({
+                    'index': index, 'errors': serializer.errors
+                })
+        self.total += len(batch)
+        valid = self.check_references(valid)
+        if valid:
+            self.insert(valid)
+
+    def check_references(self, valid):
+        tag_ids = {pk for _, data in valid for pk in data['tags']}
+        ingredient_ids = {
+            item['id'] for _, data in valid for item in data['ingredients']
+        }
+        known_tags = set(Tag.objects.filter(
+            pk__in=tag_ids
+        ).values_list('pk', flat=True))
+        known_ingredients = set(Ingredient.objects.filter(
+            pk__in=ingredient_ids
+        ).values_list('pk', flat=True))
+        checked = []
+        for index, data in valid:
+            errors = {}
+            missing_tags = [
+                pk for pk in data['tags'] if pk not in known_tags
+            ]
+            if missing_tags:
+                errors['tags'] = [f'Теги не найдены: {missing_tags}']
+            missing_ingredients = [
+                item['id'] for item in data['ingredients']
+                if item['id'] not in known_ingredients
+            ]
+            if missing_ingredients:
+                errors['ingredients'] = [
+                    f'Ингредиенты не найдены: {missing_ingredients}'
+                ]
+            if errors:
+                self.errors.append({'index': index, 'errors': errors})
+            else:
+                checked.append((index, data))
+        return checked
+
+    def insert(self, valid):
+        recipes = [
+            Recipe(
+                author=self.author,
+                name=data['name'],
+                text=data['text'],
+                cooking_time=data['cooking_time'],
+                image=data.get('image') or '',
+            )
+            for _, data in valid
+        ]
+        with transaction.atomic():
+            insert_recipes(recipes)
+            Recipe.tags.through.objects.bulk_create(
+                Recipe.tags.through(recipe_id=recipe.pk, tag_id=pk)
+                for recipe, (_, data) in zip(recipes, valid)
+                for pk in data['tags']
+            )
+            IngredientRecipe.objects.bulk_create(
+                IngredientRecipe(
+                    recipe_id=recipe.pk,
+                    ingredient_id=item['id'],
+                    amount=item['amount'],
+                )
+                for recipe, (_, data) in zip(recipes, valid)
+                for item in data['ingredients']
+            )
+            counters.change(
+                User, self.author.pk, 'recipes_count', len(recipes)
+            )
+            tasks.process_images(
+                [recipe.pk for recipe in recipes if recipe.image]
+            )
+            tasks.fan_out([recipe.pk for recipe in recipes])
+        self.created_ids.extend(recipe.pk for recipe in recipes)
@@ -0,0 +1,258 @@
+import json
+import statistics
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+
+from api.middleware import QueryStats
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import User
+
+Scenario = namedtuple(
+    'Scenario', 'name method url setup cleanup', defaults=(None, None)
+)
+
+# Бюджеты по умолчанию. Число запросов считается вместе с проверкой
+# токена и рассчитано на холодный кэш (--cold), так что в тёплом
+# режиме оно заведомо выполняется.
+BUDGETS = {
+    'tags': {'queries': 3, 'p95_ms': 200},
+    'ingredients_search': {'queries': 2, 'p95_ms': 200},
+    'recipes_list': {'queries': 8, 'p95_ms': 500},
+    'recipes_list_tags': {'queries': 9, 'p95_ms': 500},
+    'recipes_list_favorited': {'queries': 8, 'p95_ms': 500},
+    'recipes_list_cursor': {'queries': 7, 'p95_ms': 500},
+    'recipes_search': {'queries': 8, 'p95_ms': 500},
+    'recipe_detail': {'queries': 7, 'p95_ms': 300},
+    'subscriptions': {'queries': 4, 'p95_ms': 300},
+    'timeline_feed': {'queries': 8, 'p95_ms': 500},
+    'favorite_add': {'queries': 4, 'p95_ms': 300},
+    'favorite_remove': {'queries': 4, 'p95_ms': 300},
+    'cart_add': {'queries': 6, 'p95_ms': 300},
+    'cart_remove': {'queries': 6, 'p95_ms': 300},
+    'download_shopping_cart': {'queries': 2, 'p95_ms': 300},
+}
+
+
+def percentile(values, share):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * share))]
+
+
+class Command(BaseCommand):
+    """
+    Прогоняем основные эндпоинты API через тестовый клиент Django
+    на текущей базе (например, после generate_dataset) и сверяем
+    число запросов, время SQL и ответа с бюджетами. Превышение
+    бюджета завершает команду с ошибкой, так N+1 в сериализаторах
+    ловится автоматически.
+    """
+    help = 'Замер запросов и времени ответа эндпоинтов API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument(
+            '--user',
+            help='username пользователя; по умолчанию самый подписанный',
+        )
+        parser.add_argument(
+            '--budgets',
+            help='JSON-файл с бюджетами, дополняет и заменяет стандартные',
+        )
+        parser.add_argument(
+            '--cold', action='store_true',
+            help='Очищать кэш перед каждым запросом',
+        )
+        parser.add_argument(
+            '--only', nargs='+', metavar='NAME',
+            help='Запустить только указанные сценарии',
+        )
+        parser.add_argument('--output', help='Сохранить результаты в JSON')
+
+    def handle(self, *args, **options):
+        budgets = self.load_budgets(options['budgets'])
+        user = self.get_user(options['user'])
+        client = Client()
+        token, _ = Token.objects.get_or_create(user=user)
+        client.defaults['HTTP_AUTHORIZATION'] = f'Token {token.key}'
+
+        scenarios = self.scenarios(user)
+        if options['only']:
+            unknown = set(options['only']) - {s.name for s in scenarios}
+            if unknown:
+                raise CommandError(
+                    'Неизвестные сценарии: ' + ', '.join(sorted(unknown))
+                )
+            scenarios = [s for s in scenarios if s.name in options['only']]
+
+        results = []
+        with override_settings(
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']
+        ):
+            for scenario in scenarios:
+                results.append(self.measure(
+                    client, scenario, options['repeat'], options['cold']
+                ))
+
+        failures = self.report(results, budgets)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(results, file, ensure_ascii=False, indent=2)
+        if failures:
+            raise CommandError(
+                'Превышены бюджеты:\n' + '\n'.join(failures)
+            )
+        self.stdout.write(self.style.SUCCESS('Все бюджеты соблюдены.'))
+
+    def load_budgets(self, path):
+        budgets = {name: dict(budget) for name, budget in BUDGETS.items()}
+        if path:
+            try:
+                with open(path, encoding='utf-8') as file:
+                    overrides = json.load(file)
+            except (OSError, ValueError) as error:
+                raise CommandError(f'Не удалось прочитать {path}: {error}')
+            for name, budget in overrides.items():
+                budgets.setdefault(name, {}).update(budget)
+        return budgets
+
+    def get_user(self, username):
+        if username:
+            user = User.objects.filter(username=username).first()
+            if user is None:
+                raise CommandError(f'Пользователь {username} не найден')
+            return user
+        user = User.objects.annotate(
+            follows=Count('follower')
+        ).order_by('-follows', 'pk').first()
+        if user is None or not Recipe.objects.exists():
+            raise CommandError(
+                'База пуста: заполните её командой generate_dataset'
+            )
+        return user
+
+    def scenarios(self, user):
+        recipe = Recipe.objects.order_by('-favorites_count', 'pk').first()
+        toggled = Recipe.objects.exclude(
+            favorite__user=user
+        ).exclude(shopping_cart__user=user).order_by('pk').first()
+        tag = Tag.objects.order_by('pk').first()
+        ingredient = Ingredient.objects.order_by('pk').first()
+        word = recipe.name.split()[0]
+        recipes = reverse('api:recipes-list')
+        favorite = reverse('api:recipes-favorite', args=[toggled.pk])
+        cart = reverse('api:recipes-shopping-cart', args=[toggled.pk])
+        return [
+            Scenario('tags', 'get', reverse('api:tags-list')),
+            Scenario(
+                'ingredients_search', 'get',
+                reverse('api:ingredients-list')
+                + f'?name={ingredient.name[:2] if ingredient else ""}',
+            ),
+            Scenario('recipes_list', 'get', f'{recipes}?limit=10'),
+            Scenario(
+                'recipes_list_tags', 'get',
+                f'{recipes}?limit=10&tags={tag.slug if tag else ""}',
+            ),
+            Scenario(
+                'recipes_list_favorited', 'get',
+                f'{recipes}?limit=10&is_favorited=1',
+            ),
+            Scenario('recipes_list_cursor', 'get',
+                     f'{recipes}?limit=10&cursor='),
+            Scenario('recipes_search', 'get',
+                     f'{recipes}?limit=10&search={word}'),
+            Scenario('recipe_detail', 'get',
+                     reverse('api:recipes-detail', args=[recipe.pk])),
+            Scenario('subscriptions', 'get',
+                     reverse('api:users-subscriptions')
+                     + '?limit=10&recipes_limit=3'),
+            Scenario('timeline_feed', 'get',
+                     reverse('api:recipes-feed') + '?limit=10'),
+            Scenario('favorite_add', 'post', favorite,
+                     cleanup=('delete', favorite)),
+            Scenario('favorite_remove', 'delete', favorite,
+                     setup=('post', favorite)),
+            Scenario('cart_add', 'post', cart, cleanup=('delete', cart)),
+            Scenario('cart_remove', 'delete', cart, setup=('post', cart)),
+            Scenario('download_shopping_cart', 'get',
+                     reverse('api:download_shopping_cart') + '?format=txt'),
+        ]
+
+    def request(self, client, method, url):
+        response = getattr(client, method)(url)
+        if response.streaming:
+            size = sum(len(chunk) for chunk in response.streaming_content)
+        else:
+            size = len(response.content)
+        return response, size
+
+    def measure(self, client, scenario, repeat, cold):
+        # Первый прогон прогревает кэши и не учитывается.
+        timings, sql_times, queries = [], [], []
+        for iteration in range(repeat + 1):
+            if scenario.setup:
+                self.request(client, *scenario.setup)
+            if cold:
+                cache.clear()
+            # Время запросов меряется вокруг каждого execute: в журнале
+            # отладки оно округлено до миллисекунды.
+            stats = QueryStats()
+            started = time.perf_counter()
+            with connection.execute_wrapper(stats):
+                response, size = self.request(
+                    client, scenario.method, scenario.url
+                )
+            elapsed = time.perf_counter() - started
+            if scenario.cleanup:
+                self.request(client, *scenario.cleanup)
+            if response.status_code >= 400:
+                raise CommandError(
+                    f'{scenario.name}: {scenario.method.upper()} '
+                    f'{scenario.url} вернул {response.status_code}'
+                )
+            if iteration == 0:
+                continue
+            timings.append(elapsed * 1000)
+            queries.append(stats.count)
+            sql_times.append(stats.duration * 1000)
+        return {
+            'name': scenario.name,
+            'url': scenario.url,
+            'status': response.status_code,
+            'queries': max(queries),
+            'sql_ms': round(statistics.mean(sql_times), 2),
+            'p50_ms': round(percentile(timings, 0.5), 2),
+            'p95_ms': round(percentile(timings, 0.95), 2),
+            'bytes': size,
+        }
+
+    def report(self, results, budgets):
+        self.stdout.write(
+            f'{"сценарий":<24}{"код":>5}{"запр.":>7}{"SQL мс":>9}'
+            f'{"p50 мс":>9}{"p95 мс":>9}{"байт":>10}'
+        )
+        failures = []
+        for result in results:
+            self.stdout.write(
+                f'{result["name"]:<24}{result["status"]:>5}'
+                f'{result["queries"]:>7}{result["sql_ms"]:>9.2f}'
+                f'{result["p50_ms"]:>9.2f}{result["p95_ms"]:>9.2f}'
+                f'{result["bytes"]:>10}'
+            )
+            for metric, limit in budgets.get(result['name'], {}).items():
+                if result.get(metric, 0) > limit:
+                    failures.append(
+                        f'{result["name"]}: {metric} = {result[metric]}, '
+                        f'бюджет {limit}'
+                    )
+        return failures
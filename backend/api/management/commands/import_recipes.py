@@ -0,0 +1,69 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.importer import BATCH_SIZE, RecipeImporter
+from recipes.loaders import iter_json
+from users.models import User
+
+
+class Command(BaseCommand):
+    """
+    Импорт каталога рецептов из JSON-массива или NDJSON от имени
+    одного автора. Файл читается потоково, ошибки выводятся
+    с номером рецепта в файле (с нуля).
+    """
+    help = 'Массовый импорт рецептов из JSON или NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл с рецептами')
+        parser.add_argument(
+            '--author', required=True, help='username автора рецептов',
+        )
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument(
+            '--show-errors', type=int, default=20,
+            help='Сколько ошибок вывести подробно',
+        )
+
+    def handle(self, *args, **options):
+        author = User.objects.filter(username=options['author']).first()
+        if author is None:
+            raise CommandError(f'Пользователь {options["author"]} не найден')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше нуля')
+        try:
+            file = open(options['path'], encoding='utf-8')
+        except OSError as error:
+            raise CommandError(f'Не удалось открыть файл: {error}')
+
+        importer = RecipeImporter(author, options['batch_size'])
+        started = time.monotonic()
+        with file:
+            try:
+                report = importer.run(iter_json(file), self.progress)
+            except ValueError as error:
+                self.print_errors(importer.report(), options['show_errors'])
+                raise CommandError(f'Ошибка в JSON: {error}')
+        self.print_errors(report, options['show_errors'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано рецептов: {report["created"]} из {report["total"]}, '
+            f'ошибок: {len(report["errors"])} '
+            f'за {time.monotonic() - started:.2f} с'
+        ))
+
+    def progress(self, report):
+        self.stdout.write(
+            f'  обработано: {report["total"]}, создано: {report["created"]}'
+        )
+
+    def print_errors(self, report, limit):
+        for error in report['errors'][:limit]:
+            self.stdout.write(self.style.WARNING(
+                f'#{error["index"]}: '
+                f'{json.dumps(error["errors"], ensure_ascii=False)}'
+            ))
+        hidden = len(report['errors']) - limit
+        if hidden > 0:
+            self.stdout.write(self.style.WARNING(f'... и ещё {hidden}'))
@@ -0,0 +1,174 @@
+import http.client
+import json
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import quote, urlsplit
+
+from django.core.management.base import CommandError
+from rest_framework.authtoken.models import Token
+
+from api.management.commands import benchmark_endpoints
+from api.management.commands.benchmark_endpoints import percentile
+
+READ_SCENARIOS = (
+    'tags',
+    'ingredients_search',
+    'recipes_list',
+    'recipes_list_cursor',
+    'recipe_detail',
+    'subscriptions',
+    'timeline_feed',
+)
+
+
+class Command(benchmark_endpoints.Command):
+    """
+    Нагрузочный прогон запущенного сервера: параллельные клиенты
+    с keep-alive в течение заданного времени по кругу запрашивают
+    эндпоинты чтения (сценарии benchmark_endpoints). Один и тот же
+    прогон против gunicorn (WSGI) и uvicorn (ASGI) на одной базе
+    показывает разницу в пропускной способности и задержках.
+    """
+    help = 'Пропускная способность и задержки сервера под нагрузкой'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'url', help='Адрес сервера, например http://localhost:8000',
+        )
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument(
+            '--duration', type=float, default=10, help='Секунды',
+        )
+        parser.add_argument(
+            '--user',
+            help='username пользователя; по умолчанию самый подписанный',
+        )
+        parser.add_argument(
+            '--only', nargs='+', metavar='NAME', choices=READ_SCENARIOS,
+            help='Запустить только указанные сценарии',
+        )
+        parser.add_argument('--output', help='Сохранить результаты в JSON')
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1 or options['duration'] <= 0:
+            raise CommandError(
+                '--concurrency и --duration должны быть больше нуля'
+            )
+        target = urlsplit(options['url'])
+        if target.scheme not in ('http', 'https') or not target.netloc:
+            raise CommandError(f'Некорректный адрес: {options["url"]}')
+        user = self.get_user(options['user'])
+        token, _ = Token.objects.get_or_create(user=user)
+        names = options['only'] or READ_SCENARIOS
+        scenarios = [
+            scenario for scenario in self.scenarios(user)
+            if scenario.name in names
+        ]
+
+        deadline = time.monotonic() + options['duration']
+        # У каждого клиента свои счётчики, они сводятся после остановки.
+        stats = [
+            (defaultdict(list), defaultdict(int))
+            for _ in range(options['concurrency'])
+        ]
+        workers = [
+            threading.Thread(target=self.client, args=(
+                target, token.key,
+                scenarios[index % len(scenarios):]
+                + scenarios[:index % len(scenarios)],
+                deadline, *stats[index],
+            ))
+            for index in range(options['concurrency'])
+        ]
+        started = time.monotonic()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.monotonic() - started
+
+        samples, errors = defaultdict(list), defaultdict(int)
+        for worker_samples, worker_errors in stats:
+            for name, timings in worker_samples.items():
+                samples[name].extend(timings)
+            for name, count in worker_errors.items():
+                errors[name] += count
+        results = [
+            self.summary(scenario.name, samples[scenario.name],
+                         errors[scenario.name], elapsed)
+            for scenario in scenarios
+        ]
+        results.append(self.summary(
+            'всего',
+            [sample for name in samples for sample in samples[name]],
+            sum(errors.values()), elapsed,
+        ))
+        self.report(results)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump({
+                    'url': options['url'],
+                    'concurrency': options['concurrency'],
+                    'duration': round(elapsed, 2),
+                    'results': results,
+                }, file, ensure_ascii=False, indent=2)
+
+    @staticmethod
+    def client(target, token, scenarios, deadline, samples, errors):
+        """Один клиент: последовательные запросы по одному соединению."""
+        connection_class = (
+            http.client.HTTPSConnection if target.scheme == 'https'
+            else http.client.HTTPConnection
+        )
+        connection = connection_class(target.netloc, timeout=30)
+        headers = {'Authorization': f'Token {token}'}
+        paths = [
+            quote(target.path.rstrip('/') + scenario.url, safe='/?&=%:+,;@')
+            for scenario in scenarios
+        ]
+        index = 0
+        while time.monotonic() < deadline:
+            scenario = scenarios[index % len(scenarios)]
+            path = paths[index % len(scenarios)]
+            index += 1
+            started = time.perf_counter()
+            try:
+                connection.request('GET', path, headers=headers)
+                response = connection.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                errors[scenario.name] += 1
+                continue
+            samples[scenario.name].append(
+                (time.perf_counter() - started) * 1000
+            )
+            if response.status >= 400:
+                errors[scenario.name] += 1
+        connection.close()
+
+    @staticmethod
+    def summary(name, timings, errors, elapsed):
+        return {
+            'name': name,
+            'requests': len(timings),
+            'errors': errors,
+            'rps': round(len(timings) / elapsed, 1),
+            'p50_ms': round(percentile(timings, 0.5), 2) if timings else 0,
+            'p95_ms': round(percentile(timings, 0.95), 2) if timings else 0,
+            'p99_ms': round(percentile(timings, 0.99), 2) if timings else 0,
+        }
+
+    def report(self, results):
+        self.stdout.write(
+            f'{"сценарий":<24}{"запр.":>8}{"ошибки":>8}{"в сек.":>9}'
+            f'{"p50 мс":>9}{"p95 мс":>9}{"p99 мс":>9}'
+        )
+        for result in results:
+            self.stdout.write(
+                f'{result["name"]:<24}{result["requests"]:>8}'
+                f'{result["errors"]:>8}{result["rps"]:>9.1f}'
+                f'{result["p50_ms"]:>9.2f}{result["p95_ms"]:>9.2f}'
+                f'{result["p99_ms"]:>9.2f}'
+            )
@@ -0,0 +1,66 @@
+"""
+Метрики Prometheus: время ответа, число и время SQL-запросов, размер
+ответа по представлениям, попадания в кэши.
+
+Под gunicorn каждый воркер пишет метрики в файлы каталога
+PROMETHEUS_MULTIPROC_DIR, а /metrics собирает их вместе
+(см. gunicorn.conf.py). Без этой переменной окружения метрики
+живут в памяти процесса.
+"""
+import os
+
+from django.http import HttpResponse
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY,
+                               CollectorRegistry, Counter, Histogram,
+                               generate_latest, multiprocess)
+
+LABELS = ('view', 'method')
+
+REQUEST_LATENCY = Histogram(
+    'foodgram_http_request_duration_seconds',
+    'Время обработки запроса',
+    (*LABELS, 'status'),
+    buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10),
+)
+DB_QUERIES = Histogram(
+    'foodgram_db_queries_per_request',
+    'Число SQL-запросов за запрос',
+    LABELS,
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89),
+)
+DB_DURATION = Histogram(
+    'foodgram_db_duration_seconds',
+    'Суммарное время SQL-запросов за запрос',
+    LABELS,
+    buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5),
+)
+RESPONSE_SIZE = Histogram(
+    'foodgram_http_response_size_bytes',
+    'Размер тела ответа',
+    LABELS,
+    buckets=(100, 1000, 10000, 100000, 1000000, 10000000),
+)
+CACHE_REQUESTS = Counter(
+    'foodgram_cache_requests_total',
+    'Обращения к кэшам приложения',
+    ('cache', 'result'),
+)
+
+
+def cache_result(name, hits=0, misses=0):
+    """Учесть попадания и промахи кэша name."""
+    if hits:
+        CACHE_REQUESTS.labels(name, 'hit').inc(hits)
+    if misses:
+        CACHE_REQUESTS.labels(name, 'miss').inc(misses)
+
+
+def metrics_view(request):
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(
+        generate_latest(registry), content_type=CONTENT_TYPE_LATEST
+    )
@@ -0,0 +1,189 @@
+import asyncio
+import cProfile
+import pstats
+import random
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.utils.deprecation import MiddlewareMixin
+
+from api import metrics, profiling
+
+
+class QueryStats:
+    """Обёртка execute_wrapper: считает запросы и их время."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - started
+
+
+class QueryLog(QueryStats):
+    """Как QueryStats, но ещё запоминает сами запросы."""
+
+    def __init__(self):
+        super().__init__()
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return super().__call__(execute, sql, params, many, context)
+        finally:
+            self.queries.append({
+                'sql': sql,
+                'many': many,
+                'duration_ms': round(
+                    (time.perf_counter() - started) * 1000, 3
+                ),
+            })
+
+
+def wrap_queries(stack, wrapper):
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(wrapper))
+
+
+def merge_stats(*profilers):
+    """Общая статистика профилировщиков разных потоков."""
+    stats = pstats.Stats()
+    for profiler in profilers:
+        profiler.create_stats()
+        if profiler.stats:
+            stats.add(profiler)
+    return stats
+
+
+class MetricsMiddleware(MiddlewareMixin):
+    """
+    Записывает метрики каждого запроса с метками представления
+    (имя маршрута) и метода. Запросы потоковых ответов, выполненные
+    после выхода из представления, не учитываются.
+    Под ASGI обёртка запросов ставится в потоке запроса
+    (execute_wrapper привязан к соединению, а оно — к потоку).
+    """
+    excluded_views = ('metrics',)
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        stats = QueryStats()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            wrap_queries(stack, stats)
+            response = self.get_response(request)
+        self.record(request, response, stats, started)
+        return response
+
+    async def __acall__(self, request):
+        stats = QueryStats()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            await sync_to_async(wrap_queries)(stack, stats)
+            try:
+                response = await self.get_response(request)
+            finally:
+                await sync_to_async(stack.close)()
+        self.record(request, response, stats, started)
+        return response
+
+    def record(self, request, response, stats, started):
+        elapsed = time.perf_counter() - started
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        if view in self.excluded_views:
+            return
+        labels = (view, request.method)
+        metrics.REQUEST_LATENCY.labels(
+            *labels, response.status_code
+        ).observe(elapsed)
+        metrics.DB_QUERIES.labels(*labels).observe(stats.count)
+        metrics.DB_DURATION.labels(*labels).observe(stats.duration)
+        if not response.streaming:
+            metrics.RESPONSE_SIZE.labels(*labels).observe(
+                len(response.content)
+            )
+
+
+class ProfilingMiddleware(MiddlewareMixin):
+    """
+    Профилирует выборку запросов или запрос с подписанным заголовком
+    X-Profile (см. api.profiling). Id профиля возвращается
+    в заголовке ответа X-Profile-Id.
+    Под ASGI cProfile видит только свой поток, поэтому профилировщиков
+    два: в цикле событий (асинхронные обработчики, в профиль попадают
+    и параллельные запросы) и в потоке запроса, где foodgram.asgi
+    выполняет ORM и синхронные представления. Их статистика
+    сливается в один файл pstats; чтение кэша в общем пуле потоков
+    не учитывается.
+    """
+
+    def should_profile(self, request):
+        token = request.headers.get(profiling.HEADER)
+        if token:
+            return profiling.check_token(token)
+        rate = settings.PROFILING_SAMPLE_RATE
+        return rate > 0 and random.random() < rate
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        if not self.should_profile(request):
+            return self.get_response(request)
+        log = QueryLog()
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            wrap_queries(stack, log)
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+        self.save(request, response, profiler, log, started)
+        return response
+
+    async def __acall__(self, request):
+        if not self.should_profile(request):
+            return await self.get_response(request)
+        log = QueryLog()
+        loop_profiler, thread_profiler = cProfile.Profile(), cProfile.Profile()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            await sync_to_async(wrap_queries)(stack, log)
+            await sync_to_async(thread_profiler.enable)()
+            loop_profiler.enable()
+            try:
+                response = await self.get_response(request)
+            finally:
+                loop_profiler.disable()
+                await sync_to_async(thread_profiler.disable)()
+                await sync_to_async(stack.close)()
+        self.save(
+            request, response, merge_stats(loop_profiler, thread_profiler),
+            log, started,
+        )
+        return response
+
+    def save(self, request, response, profiler, log, started):
+        match = request.resolver_match
+        response['X-Profile-Id'] = profiling.save(profiler, log.queries, {
+            'created': time.time(),
+            'method': request.method,
+            'path': request.get_full_path(),
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'duration_ms': round((time.perf_counter() - started) * 1000, 3),
+            'sql_ms': round(log.duration * 1000, 3),
+        })
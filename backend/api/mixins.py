@@ -0,0 +1,107 @@
+import hashlib
+from calendar import timegm
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from api import metrics
+
+
+def validator_headers(marker, last_modified, renderer_format):
+    """ETag и метка времени Last-Modified по маркеру версии."""
+    etag = None
+    if marker is not None:
+        etag = quote_etag(hashlib.md5(
+            f'{marker}:{renderer_format}'.encode()
+        ).hexdigest())
+    timestamp = None
+    if last_modified is not None:
+        timestamp = timegm(last_modified.utctimetuple())
+    return etag, timestamp
+
+
+def not_modified(request, etag, timestamp):
+    """Ответ 304 (или 412), если копия клиента актуальна, иначе None."""
+    response = get_conditional_response(
+        request, etag=etag, last_modified=timestamp
+    )
+    if etag is not None or timestamp is not None:
+        metrics.cache_result(
+            'conditional_get',
+            hits=int(response is not None),
+            misses=int(response is None),
+        )
+    return response
+
+
+def set_validator_headers(response, etag, timestamp):
+    if etag is not None:
+        response['ETag'] = etag
+    if timestamp is not None:
+        response['Last-Modified'] = http_date(timestamp)
+    patch_vary_headers(response, ('Accept', 'Authorization'))
+
+
+class ConditionalGetMixin:
+    """
+    Условные GET-запросы для вьюсетов.
+    ETag и Last-Modified вычисляются по дешёвому маркеру версии данных,
+    при совпадении с заголовками клиента отдаётся 304 без выборки
+    и сериализации ответа.
+    """
+
+    def get_list_validators(self):
+        """Вернуть маркер версии и дату изменения списка."""
+        return None, None
+
+    def get_detail_validators(self):
+        """Вернуть маркер версии и дату изменения объекта."""
+        return None, None
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            self.get_list_validators, super().list,
+            request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            self.get_detail_validators, super().retrieve,
+            request, *args, **kwargs
+        )
+
+    def conditional_response(self, get_validators, handler,
+                             request, *args, **kwargs):
+        etag, timestamp = validator_headers(
+            *get_validators(), request.accepted_renderer.format
+        )
+        response = not_modified(request, etag, timestamp)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        set_validator_headers(response, etag, timestamp)
+        return response
+
+
+class CatalogueConditionalGetMixin(ConditionalGetMixin):
+    """
+    Условные GET-запросы для справочников: маркер версии
+    складывается из количества строк (ловит удаления)
+    и наибольшей даты изменения, всё одним агрегатным запросом.
+    """
+
+    def get_catalogue_validators(self):
+        state = self.queryset.model.objects.aggregate(
+            count=Count('id'), last_modified=Max('updated'),
+        )
+        last_modified = state['last_modified']
+        marker = f'{state["count"]}:{last_modified}'
+        return marker, last_modified
+
+    def get_list_validators(self):
+        return self.get_catalogue_validators()
+
+    def get_detail_validators(self):
+        return self.get_catalogue_validators()
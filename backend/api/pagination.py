@@ -1,6 +1,217 @@
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.paginator import Paginator as DjangoPaginator
+from django.db import connections
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from recipes.timeline import keyset
 
 
 class LimitPageNumberPagination(PageNumberPagination):
     page_size = 10
     page_size_query_param = 'limit'
+
+
+class ApproximateCountPaginator(DjangoPaginator):
+    """
+    Пагинатор, который для больших таблиц без фильтров берёт
+    оценку количества строк из статистики планировщика PostgreSQL.
+    Точный COUNT(*) выполняется, если оценка недоступна или меньше
+    PAGINATION_EXACT_COUNT_THRESHOLD.
+    """
+    count_type = 'exact'
+
+    @cached_property
+    def count(self):
+        estimate = self.estimate_count()
+        if (estimate is not None
+                and estimate >= settings.PAGINATION_EXACT_COUNT_THRESHOLD):
+            self.count_type = 'estimated'
+            return estimate
+        return super().count
+
+    def estimate_count(self):
+        queryset = self.object_list
+        query = getattr(queryset, 'query', None)
+        if query is None or query.where or query.distinct:
+            return None
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class '
+                'WHERE oid = %s::regclass',
+                [connection.ops.quote_name(queryset.model._meta.db_table)],
+            )
+            row = cursor.fetchone()
+        if row is None or row[0] < 0:
+            return None
+        return row[0]
+
+
+class ApproximateCountPagination(LimitPageNumberPagination):
+    """
+    Постраничная пагинация с приблизительным `count` для больших
+    нефильтрованных выборок. Поле `count_type` в ответе сообщает,
+    какое количество вернулось: `exact` или `estimated`.
+    """
+    django_paginator_class = ApproximateCountPaginator
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('count', self.page.paginator.count),
+            ('count_type', self.page.paginator.count_type),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema['properties']['count_type'] = {
+            'type': 'string',
+            'enum': ['exact', 'estimated'],
+        }
+        return response_schema
+
+
+class RecipePagination(ApproximateCountPagination):
+    """
+    Пагинация ленты рецептов.
+    По умолчанию постраничная, с параметром `cursor` переключается
+    на keyset-пагинацию по (pub_date, id): без COUNT(*) и OFFSET,
+    страница строится за постоянное время на любой глубине.
+    Первую страницу запрашивают с пустым `cursor=`. Результаты поиска
+    (`search`) упорядочены по релевантности, а не по дате, поэтому
+    для них `cursor` не действует и пагинация остаётся постраничной.
+    """
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def cursor_requested(self, request):
+        return self.cursor_query_param in request.query_params
+
+    @staticmethod
+    def ranked(queryset):
+        query = getattr(queryset, 'query', None)
+        return query is not None and 'search_rank' in query.annotations
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.use_cursor = (
+            self.cursor_requested(request) and not self.ranked(queryset)
+        )
+        if not self.use_cursor:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        page_size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+        self.reverse = position is not None and position[0]
+
+        results = self.fetch_page(queryset, position, page_size + 1)
+        has_more = len(results) > page_size
+        results = results[:page_size]
+        if self.reverse:
+            results.reverse()
+
+        if self.reverse:
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+        self.page = results
+        return results
+
+    def fetch_page(self, queryset, position, limit):
+        """До limit объектов после position в порядке обхода."""
+        return list(keyset(queryset, position)[:limit])
+
+    def get_paginated_response(self, data):
+        if not self.use_cursor:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        if not getattr(self, 'use_cursor', False):
+            return super().get_paginated_response_schema(schema)
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'previous': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        if not self.use_cursor:
+            return super().get_next_link()
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.use_cursor:
+            return super().get_previous_link()
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return replace_query_param(
+                self.base_url, self.cursor_query_param, ''
+            )
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def encode_cursor(self, recipe, reverse):
+        position = json.dumps(
+            [reverse, recipe.pub_date.isoformat(), recipe.pk]
+        )
+        cursor = base64.urlsafe_b64encode(position.encode()).decode()
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, cursor
+        )
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            reverse, pub_date, pk = json.loads(
+                base64.urlsafe_b64decode(cursor.encode()).decode()
+            )
+            pub_date = parse_datetime(pub_date)
+            pk = int(pk)
+        except (binascii.Error, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if pub_date is None:
+            raise NotFound(self.invalid_cursor_message)
+        return bool(reverse), pub_date, pk
+
+
+class TimelinePagination(RecipePagination):
+    """
+    Пагинация ленты подписок (recipes.timeline.Timeline): всегда
+    keyset по (pub_date, id), параметр `cursor` необязателен.
+    """
+    use_cursor = True
+
+    def cursor_requested(self, request):
+        return True
+
+    def fetch_page(self, timeline, position, limit):
+        return timeline.page(position, limit)
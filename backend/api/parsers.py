@@ -0,0 +1,25 @@
+import codecs
+
+from django.conf import settings
+from rest_framework.parsers import BaseParser
+
+from recipes.loaders import iter_json
+
+
+class RecipeStreamParser(BaseParser):
+    """
+    JSON-массив рецептов читается потоково: вместо списка
+    возвращается генератор объектов, и тело запроса не загружается
+    в память целиком. Ошибка разбора всплывает при переборе.
+    """
+    media_type = 'application/json'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        return iter_json(codecs.getreader(encoding)(stream))
+
+
+class NDJSONParser(RecipeStreamParser):
+    """По JSON-объекту в строке."""
+    media_type = 'application/x-ndjson'
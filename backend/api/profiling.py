@@ -0,0 +1,107 @@
+"""
+Профили отдельных запросов: cProfile (файл pstats) и список
+выполненных SQL-запросов с их временем (JSON).
+
+Профилируется доля PROFILING_SAMPLE_RATE запросов, а также запросы
+с заголовком X-Profile, содержащим подписанный токен сотрудника
+(выдаётся /api/profiles/token/). Хранятся последние
+PROFILING_MAX_PROFILES профилей в PROFILING_DIR (0 — хранить все).
+"""
+import json
+import os
+import re
+import uuid
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.utils import timezone
+
+HEADER = 'X-Profile'
+TOKEN_SALT = 'api.profiling'
+PROFILE_ID = re.compile(r'^[0-9]{8}T[0-9]{6}-[0-9a-f]{8}$')
+FILES = {'pstats': '.prof', 'sql': '.sql.json'}
+
+
+def make_token(user):
+    return signing.dumps({'user': user.pk}, salt=TOKEN_SALT)
+
+
+def check_token(token):
+    """
+    Токен действителен, пока его владелец остаётся активным сотрудником:
+    отозванные права действуют сразу, не дожидаясь истечения токена.
+    """
+    try:
+        payload = signing.loads(
+            token, salt=TOKEN_SALT,
+            max_age=settings.PROFILING_TOKEN_MAX_AGE,
+        )
+    except signing.BadSignature:
+        return False
+    if not isinstance(payload, dict):
+        return False
+    return get_user_model().objects.filter(
+        pk=payload.get('user'), is_active=True, is_staff=True
+    ).exists()
+
+
+def path(profile_id, kind):
+    """Путь к файлу профиля или None для некорректного id."""
+    if not PROFILE_ID.match(profile_id) or kind not in FILES:
+        return None
+    return os.path.join(settings.PROFILING_DIR, profile_id + FILES[kind])
+
+
+def save(profiler, queries, meta):
+    """
+    Сохранить профиль и SQL, вернуть id профиля. profiler — объект
+    с dump_stats(): cProfile.Profile или pstats.Stats.
+    """
+    os.makedirs(settings.PROFILING_DIR, exist_ok=True)
+    profile_id = '{}-{}'.format(
+        timezone.now().strftime('%Y%m%dT%H%M%S'), uuid.uuid4().hex[:8]
+    )
+    profiler.dump_stats(path(profile_id, 'pstats'))
+    with open(path(profile_id, 'sql'), 'w', encoding='utf-8') as file:
+        json.dump(
+            {**meta, 'id': profile_id, 'queries': queries},
+            file, ensure_ascii=False,
+        )
+    prune()
+    return profile_id
+
+
+def recent():
+    """Метаданные сохранённых профилей, новые первыми."""
+    if not os.path.isdir(settings.PROFILING_DIR):
+        return []
+    profiles = []
+    for name in sorted(os.listdir(settings.PROFILING_DIR), reverse=True):
+        if not name.endswith(FILES['sql']):
+            continue
+        profile_id = name[:-len(FILES['sql'])]
+        try:
+            with open(path(profile_id, 'sql'), encoding='utf-8') as file:
+                data = json.load(file)
+        except (OSError, ValueError, TypeError):
+            continue
+        data['query_count'] = len(data.pop('queries', []))
+        profiles.append(data)
+    return profiles
+
+
+def prune():
+    if settings.PROFILING_MAX_PROFILES < 1:
+        return
+    names = sorted(
+        name[:-len(FILES['sql'])]
+        for name in os.listdir(settings.PROFILING_DIR)
+        if name.endswith(FILES['sql'])
+    )
+    for profile_id in names[:-settings.PROFILING_MAX_PROFILES]:
+        for kind in FILES:
+            try:
+                os.remove(path(profile_id, kind))
+            except (OSError, TypeError):
+                pass
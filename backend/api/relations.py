@@ -0,0 +1,60 @@
+"""
+Связи текущего пользователя на время запроса: на каких авторов он
+подписан, какие рецепты у него в избранном и в корзине.
+
+Каждое множество загружается одним запросом при первом обращении
+и хранится на объекте запроса, поэтому его разделяют все
+сериализаторы ответа, включая вложенные.
+"""
+from django.utils.functional import cached_property
+
+from recipes.models import Favorite, Shopping
+from users.models import Follow
+
+REQUEST_ATTRIBUTE = '_user_relations'
+
+
+class UserRelations:
+
+    def __init__(self, user):
+        self.user = user
+
+    def _ids(self, queryset, field):
+        if self.user is None or self.user.is_anonymous:
+            return frozenset()
+        return frozenset(
+            queryset.filter(user=self.user).values_list(field, flat=True)
+        )
+
+    @cached_property
+    def followed_ids(self):
+        return self._ids(Follow.objects, 'author_id')
+
+    @cached_property
+    def favorite_ids(self):
+        return self._ids(Favorite.objects, 'recipe_id')
+
+    @cached_property
+    def cart_ids(self):
+        return self._ids(Shopping.objects, 'recipe_id')
+
+    def is_subscribed(self, author_id):
+        return author_id in self.followed_ids
+
+    def is_favorited(self, recipe_id):
+        return recipe_id in self.favorite_ids
+
+    def is_in_shopping_cart(self, recipe_id):
+        return recipe_id in self.cart_ids
+
+
+def get_relations(request):
+    """Связи пользователя запроса; request может быть None."""
+    if request is None:
+        return UserRelations(None)
+    request = getattr(request, '_request', request)
+    relations = getattr(request, REQUEST_ATTRIBUTE, None)
+    if relations is None or relations.user != request.user:
+        relations = UserRelations(request.user)
+        setattr(request, REQUEST_ATTRIBUTE, relations)
+    return relations
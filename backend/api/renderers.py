@@ -0,0 +1,116 @@
+import csv
+import io
+import json
+import os
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+from rest_framework.renderers import BaseRenderer
+
+
+class ShoppingListRenderer(BaseRenderer):
+    """
+    Базовый рендерер списка покупок.
+    Строки (название, единица, количество) превращаются в файл
+    по частям, чтобы ответ можно было отдавать потоком.
+    """
+    charset = 'utf-8'
+    title = 'Список покупок'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if not isinstance(data, (list, tuple)):
+            return json.dumps(data, ensure_ascii=False).encode()
+        return b''.join(self.stream(data))
+
+    def stream(self, rows):
+        raise NotImplementedError
+
+    @classmethod
+    def available(cls):
+        """Можно ли сейчас выгрузить файл в этом формате."""
+        return True
+
+
+class ShoppingListTextRenderer(ShoppingListRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream(self, rows):
+        for name, units, total in rows:
+            yield f'{name} ({units}) - {total}\n'.encode()
+
+
+class ShoppingListCSVRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+    header = ('Ингредиент', 'Единица измерения', 'Количество')
+
+    def stream(self, rows):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(self.header)
+        for row in rows:
+            writer.writerow(row)
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue().encode()
+
+
+class ShoppingListPDFRenderer(ShoppingListRenderer):
+    """
+    PDF собирается в памяти (формат требует таблицу смещений в конце),
+    потоком отдаются уже готовые куски. Для кириллицы нужен TTF-шрифт
+    из SHOPPING_CART_PDF_FONT; без него встроенные шрифты PDF вывели бы
+    нечитаемый текст, поэтому формат недоступен.
+    """
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+    font_name = 'ShoppingListFont'
+    font_size = 12
+    margin = 50
+    chunk_size = 64 * 1024
+
+    def stream(self, rows):
+        font = self.get_font()
+        buffer = io.BytesIO()
+        pdf = canvas.Canvas(buffer, pagesize=A4)
+        width, height = A4
+        y = height - self.margin
+        pdf.setFont(font, self.font_size + 4)
+        pdf.drawString(self.margin, y, self.title)
+        y -= self.font_size * 2
+        pdf.setFont(font, self.font_size)
+        for name, units, total in rows:
+            if y < self.margin:
+                pdf.showPage()
+                pdf.setFont(font, self.font_size)
+                y = height - self.margin
+            pdf.drawString(self.margin, y, f'{name} ({units}) - {total}')
+            y -= self.font_size * 1.5
+        pdf.save()
+        buffer.seek(0)
+        yield from iter(lambda: buffer.read(self.chunk_size), b'')
+
+    @classmethod
+    def available(cls):
+        return (
+            cls.font_name in pdfmetrics.getRegisteredFontNames()
+            or os.path.exists(settings.SHOPPING_CART_PDF_FONT)
+        )
+
+    def get_font(self):
+        if self.font_name in pdfmetrics.getRegisteredFontNames():
+            return self.font_name
+        path = settings.SHOPPING_CART_PDF_FONT
+        if not os.path.exists(path):
+            raise ImproperlyConfigured(
+                f'Шрифт для PDF не найден: {path} (SHOPPING_CART_PDF_FONT)'
+            )
+        pdfmetrics.registerFont(TTFont(self.font_name, path))
+        return self.font_name
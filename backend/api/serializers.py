@@ -1,14 +1,20 @@
+from collections import OrderedDict
+
 from django.contrib.auth import get_user_model
-from django.db.models import F
+from django.core.files.storage import default_storage
+from django.db import models, transaction
+from django.db.models import prefetch_related_objects
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 from rest_framework.fields import SerializerMethodField
 from rest_framework.generics import get_object_or_404
-from rest_framework.settings import api_settings
 
-from recipes.models import (Ingredient, IngredientRecipe, Recipe, Shopping,
-                            Tag, TagRecipe)
+from api import cache as recipe_cache
+from api.relations import get_relations
+from recipes import shopping
+from recipes.models import (Ingredient, IngredientRecipe, Recipe,
+                            RecipeQuerySet, Shopping, Tag, TagRecipe)
 from users.models import Follow, User
 
 User = get_user_model()
@@ -46,10 +52,37 @@ class UserSerializer(UserSerializer):
         """
         Провоеряем подписанны пользователи.
         """
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        return get_relations(
+            self.context.get('request')
+        ).is_subscribed(obj.pk)
+
+
+class RenditionsField(serializers.ReadOnlyField):
+    """
+    Ссылки на уменьшенные копии изображения по размерам и форматам.
+    None, пока копии строятся в фоне: тогда клиент берёт image.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = 'renditions'
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        if not value:
+            return None
         request = self.context.get('request')
-        if self.context.get('request').user.is_anonymous:
-            return False
-        return obj.following.filter(user=request.user).exists()
+        return {
+            name: {
+                image_format: (
+                    request.build_absolute_uri(default_storage.url(path))
+                    if request else default_storage.url(path)
+                )
+                for image_format, path in files.items()
+            }
+            for name, files in value.items()
+        }
 
 
 class FollowShortRecipeSerializer(serializers.ModelSerializer):
@@ -83,7 +116,8 @@ class FollowSerializer(serializers.ModelSerializer):
             else obj.author.recipe.all())
         return FollowShortRecipeSerializer(
             recipes,
-            many=True).data
+            many=True,
+            context={'request': request}).data
 
     def validate(self, data):
         request = self.context['request']
@@ -122,7 +156,7 @@ class IngredientSerializer(serializers.ModelSerializer):
     """
     class Meta:
         model = Ingredient
-        fields = '__all__'
+        fields = ('id', 'name', 'measurement_unit')
 
 
 class RecipeIngredientSerializer(serializers.ModelSerializer):
@@ -145,6 +179,14 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
         )
 
 
+class RecipeListSerializer(serializers.ListSerializer):
+    """Список рецептов: общая часть читается из кэша одним запросом."""
+
+    def to_representation(self, data):
+        recipes = data.all() if isinstance(data, models.Manager) else data
+        return self.child.to_representation_many(list(recipes))
+
+
 class RecipeReadSerializer(serializers.ModelSerializer):
     """ Сериализатор для работы и просмотра рецепта """
     tags = TagSerializer(read_only=False, many=True)
@@ -153,6 +195,7 @@ class RecipeReadSerializer(serializers.ModelSerializer):
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = SerializerMethodField(read_only=True)
     image = Base64ImageField(max_length=None)
+    images = RenditionsField()
 
     class Meta:
         model = Recipe
@@ -165,25 +208,98 @@ class RecipeReadSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'images',
             'text',
             'cooking_time',
         )
+        list_serializer_class = RecipeListSerializer
+
+    user_fields = ('is_favorited', 'is_in_shopping_cart')
+
+    def to_representation(self, instance):
+        return self.to_representation_many([instance])[0]
+
+    def to_representation_many(self, recipes, cached=None):
+        """
+        Общая часть представления берётся из кэша, для промахов
+        связанные объекты подгружаются разом. Флаги текущего
+        пользователя добавляются поверх при каждом ответе.
+        cached — уже прочитанный результат recipe_cache.lookup().
+        """
+        if cached is None:
+            cached = recipe_cache.lookup(
+                [recipe.pk for recipe in recipes],
+                self.get_cache_host(),
+            )
+        hits, keys = cached
+        missing = [recipe for recipe in recipes if recipe.pk not in hits]
+        if missing:
+            prefetch_related_objects(
+                missing, *RecipeQuerySet.prefetch_lookups()
+            )
+            fresh = {
+                recipe.pk: self.to_shared_representation(recipe)
+                for recipe in missing
+            }
+            recipe_cache.store(keys, fresh)
+            hits.update(fresh)
+        return [
+            self.with_user_fields(hits[recipe.pk], recipe)
+            for recipe in recipes
+        ]
+
+    def get_cache_host(self):
+        """Хост входит в ключ кэша: в представлении абсолютные URL."""
+        request = self.context.get('request')
+        return request.build_absolute_uri('/') if request else ''
+
+    def to_shared_representation(self, instance):
+        """Представление рецепта без флагов пользователя."""
+        ret = OrderedDict()
+        for field in self._readable_fields:
+            if field.field_name in self.user_fields:
+                continue
+            attribute = field.get_attribute(instance)
+            ret[field.field_name] = (
+                None if attribute is None
+                else field.to_representation(attribute)
+            )
+        if ret['author'] is not None:
+            ret['author'] = OrderedDict(ret['author'])
+            ret['author'].pop('is_subscribed', None)
+        return ret
+
+    def with_user_fields(self, shared, instance):
+        ret = OrderedDict()
+        for field_name in self.Meta.fields:
+            if field_name in self.user_fields:
+                method = getattr(self, f'get_{field_name}')
+                ret[field_name] = method(instance)
+            else:
+                ret[field_name] = shared[field_name]
+        if ret['author'] is not None:
+            ret['author'] = OrderedDict(ret['author'])
+            ret['author']['is_subscribed'] = (
+                self.get_author_is_subscribed(instance)
+            )
+        return ret
+
+    def get_author_is_subscribed(self, obj):
+        return self.fields['author'].get_is_subscribed(obj.author)
 
     def get_ingredients(self, obj):
-        ingredients = IngredientRecipe.objects.filter(recipe=obj)
+        ingredients = obj.recipe_to_ingredient.all()
         return RecipeIngredientSerializer(ingredients, many=True).data
 
     def get_is_favorited(self, obj):
-        user = self.context.get('request').user
-        if user.is_anonymous:
-            return False
-        return obj.favorite.filter(user=user).exists()
+        return get_relations(
+            self.context.get('request')
+        ).is_favorited(obj.pk)
 
     def get_is_in_shopping_cart(self, obj):
-        user = self.context.get('request').user
-        if user.is_anonymous:
-            return False
-        return obj.shopping_cart.filter(user=user).exists()
+        return get_relations(
+            self.context.get('request')
+        ).is_in_shopping_cart(obj.pk)
 
 
 class TagRecipeSerializer(serializers.ModelSerializer):
@@ -277,37 +393,82 @@ class RecipeAddSerializer(serializers.ModelSerializer):
         IngredientRecipe.objects.bulk_create(ingredient_list)
 
     @staticmethod
-    def add_ingredients(ingredients, recipe):
-        for ingredient in ingredients:
-            ingredient_id = ingredient['id']
-            amount = ingredient['amount']
-            if IngredientRecipe.objects.filter(
-                    recipe=recipe, ingredient=ingredient_id).exists():
-                amount += F('amount')
-            IngredientRecipe.objects.update_or_create(
-                recipe=recipe, ingredient=ingredient_id,
-                defaults={'amount': amount}
+    def update_ingredients(recipe, ingredients):
+        """
+        Сверить состав рецепта с новым и записать только разницу:
+        новые строки вставляются, изменившиеся обновляются,
+        лишние удаляются — по одному запросу на каждое действие.
+        Возвращает старые и новые количества для списков покупок.
+        """
+        current = {
+            row.ingredient_id: row
+            for row in IngredientRecipe.objects.filter(recipe=recipe).only(
+                'id', 'ingredient_id', 'amount'
             )
+        }
+        old_amounts = {
+            ingredient_id: row.amount
+            for ingredient_id, row in current.items()
+        }
+        wanted = {item['id'].pk: item['amount'] for item in ingredients}
+        created, changed = [], []
+        for ingredient_id, amount in wanted.items():
+            row = current.get(ingredient_id)
+            if row is None:
+                created.append(IngredientRecipe(
+                    recipe=recipe, ingredient_id=ingredient_id, amount=amount
+                ))
+            elif row.amount != amount:
+                row.amount = amount
+                changed.append(row)
+        removed = [
+            row.pk for ingredient_id, row in current.items()
+            if ingredient_id not in wanted
+        ]
+        if removed:
+            IngredientRecipe.objects.filter(pk__in=removed).delete()
+        if changed:
+            IngredientRecipe.objects.bulk_update(changed, ('amount',))
+        if created:
+            IngredientRecipe.objects.bulk_create(created)
+        return old_amounts, wanted
 
     def create(self, validated_data):
         request = self.context.get('request', None)
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
 
-        recipe = Recipe.objects.create(author=request.user, **validated_data)
-        recipe.tags.set(tags)
-
-        self.create_ingredients(recipe, ingredients)
+        with transaction.atomic():
+            recipe = Recipe.objects.create(
+                author=request.user, **validated_data
+            )
+            recipe.tags.set(tags)
+            self.create_ingredients(recipe, ingredients)
 
         return recipe
 
     def update(self, recipe, validated_data):
-        ingredients = validated_data.pop('ingredients')
-        tags = validated_data.pop('tags')
-        IngredientRecipe.objects.filter(recipe=recipe).delete()
-        self.create_ingredients(ingredients, recipe)
-        recipe.tags.set(tags)
-        return super().update(recipe, validated_data)
+        """
+        Без ingredients или tags (PATCH) соответствующая часть
+        не меняется. Кэш рецепта сбрасывается сохранением рецепта,
+        поэтому массовые операции без сигналов здесь допустимы.
+        renditions не перезаписывается (Recipe.fields_to_save).
+        """
+        ingredients = validated_data.pop('ingredients', None)
+        tags = validated_data.pop('tags', None)
+        with transaction.atomic():
+            if ingredients is not None:
+                old_amounts, new_amounts = self.update_ingredients(
+                    recipe, ingredients
+                )
+                shopping.recipe_changed(recipe.pk, old_amounts, new_amounts)
+            if tags is not None:
+                # set() сам сверяет связи и меняет только разницу.
+                recipe.tags.set(tags)
+            for attr, value in validated_data.items():
+                setattr(recipe, attr, value)
+            recipe.save(update_fields=recipe.fields_to_save())
+        return recipe
 
     def to_representation(self, instance):
         return RecipeReadSerializer(instance, context={
@@ -315,60 +476,79 @@ class RecipeAddSerializer(serializers.ModelSerializer):
         }).data
 
 
+class IngredientAmountSerializer(serializers.Serializer):
+    """Ингредиент рецепта при импорте: id проверяется пачкой."""
+    id = serializers.IntegerField()
+    amount = serializers.IntegerField(min_value=1, max_value=3000)
+
+
+class RecipeImportSerializer(serializers.Serializer):
+    """
+    Проверка одного рецепта при массовом импорте без запросов к БД:
+    существование тегов и ингредиентов проверяет api.importer
+    сразу для всей пачки.
+    """
+    name = serializers.CharField(max_length=100)
+    text = serializers.CharField(max_length=250)
+    cooking_time = serializers.IntegerField(min_value=1, max_value=100)
+    tags = serializers.ListField(
+        child=serializers.IntegerField(), allow_empty=False
+    )
+    ingredients = IngredientAmountSerializer(many=True, allow_empty=False)
+    image = Base64ImageField(max_length=None, required=False)
+
+    def validate_tags(self, tags):
+        if len(set(tags)) != len(tags):
+            raise serializers.ValidationError('Теги должны быть уникальными')
+        return tags
+
+    def validate_ingredients(self, ingredients):
+        if len({item['id'] for item in ingredients}) != len(ingredients):
+            raise serializers.ValidationError(
+                'Ингридиенты должны быть уникальными'
+            )
+        return ingredients
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    """Список id рецептов для пакетных операций с избранным и корзиной."""
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=500,
+    )
+
+
 class ShortRecipeShoppingSerializer(serializers.ModelSerializer):
     """Сериализатор для краткого отображения сведений о рецепте."""
+    images = RenditionsField()
 
     class Meta:
         model = Recipe
         fields = ('id', 'name',
-                  'image', 'cooking_time')
+                  'image', 'images', 'cooking_time')
 
 
 class SubscribeSerializer(UserSerializer):
     """
     Сериализатор вывода авторов на которых подписан текущий пользователь.
+    Ожидает авторов из UserViewSet.with_subscription_data():
+    превью рецептов загружены заранее.
     """
-    recipes = ShortRecipeShoppingSerializer(many=True, read_only=True)
-    recipes_count = SerializerMethodField()
-    is_subscribed = serializers.SerializerMethodField()
+    recipes = SerializerMethodField()
 
     class Meta:
         model = User
-        fields = (
-            'email',
-            'id',
-            'username',
-            'first_name',
-            'last_name',
-            'is_subscribed',
-            'recipes',
-            'recipes_count',
-        )
-        read_only_fields = ('email', 'username', 'first_name', 'last_name')
-
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
+        fields = ('email', 'id', 'username', 'first_name', 'last_name',
+                  'is_subscribed', 'recipes', 'recipes_count')
+        read_only_fields = ('email', 'username', 'first_name', 'last_name',
+                            'recipes_count')
 
     def get_recipes(self, obj):
-        recipes_limit = int(self.context['request'].GET.get(
-            'recipes_limit', api_settings.PAGE_SIZE))
-
-        user = get_object_or_404(User, pk=obj.pk)
-        recipes = Recipe.objects.filter(author=user)[:recipes_limit]
-
-        return ShortRecipeShoppingSerializer(recipes, many=True).data
-
-    def get_is_subscribed(self, obj):
-        if not self.context['request'].user.is_authenticated:
-            return False
-
-        return Follow.objects.filter(
-            author=obj, user=self.context['request'].user).exists()
-
-    class Meta:
-        fields = ('id', 'email', 'username', 'first_name', 'last_name',
-                  'is_subscribed', 'recipes_count', 'recipes')
-        model = User
+        return ShortRecipeShoppingSerializer(
+            obj.preview_recipes, many=True,
+            context={'request': self.context.get('request')}
+        ).data
 
 
 class ShoppingSerializer(serializers.ModelSerializer):
@@ -0,0 +1,58 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from api import cache as recipe_cache
+from recipes.models import Ingredient, IngredientRecipe, Recipe, Tag
+
+User = get_user_model()
+
+
+def invalidate_on_commit(recipe_ids):
+    recipe_ids = list(recipe_ids)
+    transaction.on_commit(
+        lambda: recipe_cache.invalidate_recipes(recipe_ids)
+    )
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    invalidate_on_commit([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=IngredientRecipe)
+def recipe_ingredient_changed(sender, instance, **kwargs):
+    invalidate_on_commit([instance.recipe_id])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set,
+                        **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        invalidate_on_commit([instance.pk])
+    elif pk_set:
+        invalidate_on_commit(pk_set)
+    else:
+        transaction.on_commit(recipe_cache.invalidate_catalogue)
+
+
+@receiver([post_save, post_delete], sender=Tag)
+@receiver([post_save, post_delete], sender=Ingredient)
+def catalogue_changed(sender, **kwargs):
+    transaction.on_commit(recipe_cache.invalidate_catalogue)
+
+
+@receiver(post_save, sender=User)
+def author_changed(sender, instance, created, update_fields, **kwargs):
+    """
+    Данные автора входят в кэш рецепта. Обновление last_login
+    при входе на представление не влияет.
+    """
+    if created or update_fields == frozenset(('last_login',)):
+        return
+    invalidate_on_commit(
+        instance.recipes.values_list('id', flat=True)
+    )
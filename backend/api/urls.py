@@ -1,9 +1,12 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from api.views import (DownloadShoppingCartView, IngredientViewSet,
-                       RecipeShoppingViewSet, RecipeViewSet, TagViewSet,
-                       UserViewSet)
+from api.views import (DownloadShoppingCartView, FavoriteBatchView,
+                       IngredientViewSet, ProfileDownloadView,
+                       ProfileListView, ProfileTokenView,
+                       RecipeShoppingViewSet, RecipeViewSet,
+                       ShoppingCartBatchView, TagViewSet, UserViewSet)
 
 app_name = 'api'
 
@@ -20,7 +23,51 @@ urlpatterns = [
         DownloadShoppingCartView.as_view(),
         name='download_shopping_cart',
     ),
+    # До роутера: иначе favorite и shopping_cart сойдут за id рецепта.
+    path(
+        'recipes/favorite/',
+        FavoriteBatchView.as_view(),
+        name='favorite_batch',
+    ),
+    path(
+        'recipes/shopping_cart/',
+        ShoppingCartBatchView.as_view(),
+        name='shopping_cart_batch',
+    ),
+    path('profiles/', ProfileListView.as_view(), name='profiles'),
+    path(
+        'profiles/token/', ProfileTokenView.as_view(), name='profile_token'
+    ),
+    path(
+        'profiles/<str:profile_id>/',
+        ProfileDownloadView.as_view(),
+        name='profile_download',
+    ),
     path('', include(router.urls)),
     path('', include('djoser.urls')),
     path('auth/', include('djoser.urls.authtoken')),
 ]
+
+if settings.ASYNC_VIEWS:
+    from api import async_views
+
+    # Те же имена маршрутов; стоят первыми и перекрывают роутер.
+    urlpatterns = [
+        path('tags/', async_views.tag_list, name='tags-list'),
+        path(
+            'ingredients/', async_views.ingredient_list,
+            name='ingredients-list',
+        ),
+        path('recipes/', async_views.recipe_list, name='recipes-list'),
+        path(
+            'recipes/feed/', async_views.recipe_feed, name='recipes-feed',
+        ),
+        path(
+            'recipes/<int:pk>/', async_views.recipe_detail,
+            name='recipes-detail',
+        ),
+        path(
+            'users/subscriptions/', async_views.subscriptions,
+            name='users-subscriptions',
+        ),
+    ] + urlpatterns
@@ -1,33 +1,53 @@
+import os
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import F, Sum
-from django.http import HttpResponse
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import BooleanField, Sum, Value
+from django.http import FileResponse, Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 from rest_framework import status, views, viewsets
 from rest_framework.decorators import action
-from rest_framework.permissions import SAFE_METHODS, IsAuthenticated
+from rest_framework.exceptions import (NotAcceptable, NotFound,
+                                       ValidationError)
+from rest_framework.permissions import (SAFE_METHODS, IsAdminUser,
+                                        IsAuthenticated)
 from rest_framework.views import Response
 from rest_framework.viewsets import ModelViewSet
 
+from api import cache as recipe_cache
+from api import metrics, profiling
 from api.filters import IngredientFilter, RecipeFilter
-from api.pagination import LimitPageNumberPagination
+from api.importer import RecipeImporter
+from api.mixins import CatalogueConditionalGetMixin, ConditionalGetMixin
+from api.pagination import (ApproximateCountPagination, RecipePagination,
+                            TimelinePagination)
+from api.parsers import NDJSONParser, RecipeStreamParser
 from api.permissions import IsAdminOrReadOnly, IsAuthorOrAdminOrReadOnly
+from api.relations import get_relations
+from api.renderers import (ShoppingListCSVRenderer, ShoppingListPDFRenderer,
+                           ShoppingListTextRenderer)
 from api.serializers import (IngredientSerializer, RecipeAddSerializer,
-                             RecipeReadSerializer,
+                             RecipeIdsSerializer, RecipeReadSerializer,
                              ShortRecipeShoppingSerializer,
                              SubscribeSerializer, TagSerializer,
                              UserCreateSerializer, UserSerializer)
+from recipes import shopping, user_lists
+from recipes.index import ingredient_index
 from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
-                            Shopping, Tag)
+                            Shopping, ShoppingListItem, Tag)
+from recipes.timeline import Timeline
 from users.models import Follow, User
 
 User = get_user_model()
 now = timezone.now()
 
 
-class TagViewSet(ModelViewSet):
+class TagViewSet(CatalogueConditionalGetMixin, ModelViewSet):
     """Вывод тегов."""
     serializer_class = TagSerializer
     permission_classes = (IsAdminOrReadOnly,)
@@ -35,30 +55,132 @@ class TagViewSet(ModelViewSet):
     pagination_class = None
 
 
-class IngredientViewSet(viewsets.ModelViewSet):
-    """Вывод ингридиентов."""
+class IngredientViewSet(CatalogueConditionalGetMixin,
+                        viewsets.ModelViewSet):
+    """
+    Вывод ингридиентов.
+    Список и поиск по `name` отдаются из индекса в памяти без
+    обращения к базе; `limit` ограничивает число результатов.
+    """
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
-    permission_classes = (IsAuthorOrAdminOrReadOnly,)
+    permission_classes = (IsAdminOrReadOnly,)
     filter_backends = (DjangoFilterBackend,)
-    search_fields = ('^name',)
     filterset_class = IngredientFilter
     pagination_class = None
 
+    def get_list_validators(self):
+        return ingredient_index.validators
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            self.get_list_validators, self.search,
+            request, *args, **kwargs
+        )
+
+    def search(self, request, *args, **kwargs):
+        limit = request.query_params.get('limit')
+        if limit is not None:
+            try:
+                limit = int(limit)
+            except ValueError:
+                limit = 0
+            if limit < 1:
+                raise ValidationError(
+                    {'limit': 'Ожидается положительное целое число.'}
+                )
+        return Response(ingredient_index.search(
+            request.query_params.get('name', ''), limit
+        ))
+
+
+def recipe_validators(recipe, user, relations, version):
+    """
+    В маркер входят дата изменения рецепта, версия его кэша
+    (меняется и при правке тегов, ингредиентов, автора)
+    и флаги текущего пользователя. Last-Modified отдаётся
+    только анонимам: для них ответ не зависит от флагов.
+    """
+    marker = ':'.join(str(part) for part in (
+        recipe.pk,
+        recipe.updated.isoformat(),
+        version,
+        user.pk,
+        relations.is_favorited(recipe.pk),
+        relations.is_in_shopping_cart(recipe.pk),
+        relations.is_subscribed(recipe.author_id),
+    ))
+    if user.is_authenticated:
+        return marker, None
+    return marker, recipe.updated
+
 
-class RecipeViewSet(ModelViewSet):
+class RecipeViewSet(ConditionalGetMixin, ModelViewSet):
     """Вывод рецептов."""
     queryset = Recipe.objects.all()
     permission_classes = (IsAuthorOrAdminOrReadOnly,)
-    pagination_class = LimitPageNumberPagination
+    pagination_class = RecipePagination
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
 
+    def get_queryset(self):
+        if self.request.method in SAFE_METHODS:
+            return Recipe.objects.feed()
+        return super().get_queryset()
+
+    def get_object(self):
+        if not hasattr(self, '_object'):
+            self._object = super().get_object()
+        return self._object
+
+    def get_detail_validators(self):
+        recipe = self.get_object()
+        return recipe_validators(
+            recipe, self.request.user, get_relations(self.request),
+            recipe_cache.get_version(recipe.pk),
+        )
+
     def get_serializer_class(self):
         if self.request.method == 'GET':
             return RecipeReadSerializer
         return RecipeAddSerializer
 
+    @action(
+        detail=False,
+        methods=['post'],
+        permission_classes=[IsAuthenticated],
+        parser_classes=[RecipeStreamParser, NDJSONParser],
+    )
+    def bulk(self, request):
+        """
+        Массовое создание рецептов текущего пользователя из JSON-массива
+        или NDJSON. Корректные рецепты создаются, для остальных
+        в ответе перечислены ошибки с номером рецепта.
+        """
+        importer = RecipeImporter(request.user)
+        try:
+            report = importer.run(request.data)
+        except ValueError as error:
+            report = importer.report()
+            report['detail'] = f'Ошибка в JSON: {error}'
+        if report['created']:
+            return Response(report, status=status.HTTP_201_CREATED)
+        return Response(report, status=status.HTTP_400_BAD_REQUEST)
+
+    @action(
+        detail=False,
+        permission_classes=[IsAuthenticated],
+        pagination_class=TimelinePagination,
+    )
+    def feed(self, request):
+        """
+        Лента подписок: рецепты авторов, на которых подписан
+        пользователь, от новых к старым (recipes.timeline).
+        """
+        page = self.paginate_queryset(Timeline(request.user))
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
 
 class RecipeShoppingViewSet(ModelViewSet):
     """
@@ -66,10 +188,15 @@ class RecipeShoppingViewSet(ModelViewSet):
     """
     queryset = Recipe.objects.all()
     permission_classes = (IsAuthorOrAdminOrReadOnly | IsAdminOrReadOnly,)
-    pagination_class = LimitPageNumberPagination
+    pagination_class = RecipePagination
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
 
+    def get_queryset(self):
+        if self.request.method in SAFE_METHODS:
+            return Recipe.objects.feed()
+        return super().get_queryset()
+
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
@@ -100,62 +227,224 @@ class RecipeShoppingViewSet(ModelViewSet):
         else:
             return self.delete_from(Shopping, request.user, pk)
 
+    @staticmethod
+    def recipe_id(pk):
+        try:
+            return int(pk)
+        except ValueError:
+            raise Http404
+
     def add_to(self, model, user, pk):
-        if model.objects.filter(user=user, recipe__id=pk).exists():
+        """
+        Вставка одним запросом (recipes.user_lists): рецепт либо
+        добавлен, либо уже был, либо не существует. Повторный клик
+        получает 400, а не IntegrityError. Карточку для ответа
+        возвращает add_card без отдельного чтения рецепта.
+        """
+        pk = self.recipe_id(pk)
+        recipe = user_lists.add_card(model, user.pk, pk)
+        if recipe is None:
+            if not Recipe.objects.filter(pk=pk).exists():
+                raise Http404
             return Response({'errors': 'Рецепт уже добавлен!'},
                             status=status.HTTP_400_BAD_REQUEST)
-        recipe = get_object_or_404(Recipe, id=pk)
-        model.objects.create(user=user, recipe=recipe)
-        serializer = ShortRecipeShoppingSerializer(recipe)
+        serializer = ShortRecipeShoppingSerializer(
+            recipe, context=self.get_serializer_context()
+        )
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def delete_from(self, model, user, pk):
-        obj = model.objects.filter(user=user, recipe__id=pk)
-        if obj.exists():
-            obj.delete()
+        if user_lists.remove(model, user.pk, [self.recipe_id(pk)]):
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response({'errors': 'Рецепт уже удален!'},
                         status=status.HTTP_400_BAD_REQUEST)
 
 
+class RecipeListBatchView(views.APIView):
+    """
+    Добавление (POST) и удаление (DELETE) нескольких рецептов
+    в избранном или корзине. Тело: {"recipes": [id, ...]}, каждая
+    операция — один запрос к таблице, см. recipes.user_lists.
+    В ответе статус по каждому id.
+    """
+    permission_classes = (IsAuthenticated,)
+    model = None
+
+    def get_recipe_ids(self, request):
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return list(dict.fromkeys(serializer.validated_data['recipes']))
+
+    def post(self, request):
+        recipe_ids = self.get_recipe_ids(request)
+        added = set(user_lists.add(self.model, request.user.pk, recipe_ids))
+        rest = [pk for pk in recipe_ids if pk not in added]
+        known = set(Recipe.objects.filter(
+            pk__in=rest
+        ).values_list('pk', flat=True)) if rest else set()
+        return Response({'recipes': [
+            {'id': pk, 'status': (
+                'added' if pk in added
+                else 'exists' if pk in known
+                else 'not_found'
+            )}
+            for pk in recipe_ids
+        ]})
+
+    def delete(self, request):
+        recipe_ids = self.get_recipe_ids(request)
+        removed = set(
+            user_lists.remove(self.model, request.user.pk, recipe_ids)
+        )
+        return Response({'recipes': [
+            {'id': pk, 'status': 'removed' if pk in removed else 'absent'}
+            for pk in recipe_ids
+        ]})
+
+
+class FavoriteBatchView(RecipeListBatchView):
+    model = Favorite
+
+
+class ShoppingCartBatchView(RecipeListBatchView):
+    model = Shopping
+
+
 class DownloadShoppingCartView(views.APIView):
-    def get(self, request):
-        items = IngredientRecipe.objects.select_related(
-            'recipe', 'ingredient'
+    """
+    Выгрузка списка покупок в txt, csv или pdf (?format=).
+    Файл отдаётся потоком; для авторизованных пользователей готовый
+    файл кэшируется до следующего изменения корзины или ингредиентов.
+    """
+    renderer_classes = (
+        ShoppingListTextRenderer,
+        ShoppingListCSVRenderer,
+        ShoppingListPDFRenderer,
+    )
+    filename = 'foodgram_shopping_cart'
+
+    def perform_content_negotiation(self, request, force=False):
+        """
+        Формат, который сейчас выгрузить нельзя (PDF без шрифта),
+        отклоняется с 406; сама ошибка отдаётся первым рендерером.
+        """
+        renderer, media_type = super().perform_content_negotiation(
+            request, force
         )
+        if renderer.available():
+            return renderer, media_type
+        if force:
+            renderer = self.get_renderers()[0]
+            return renderer, renderer.media_type
+        raise NotAcceptable(
+            f'Выгрузка в формате {renderer.format} недоступна.'
+        )
+
+    def get(self, request):
+        renderer = request.accepted_renderer
         if request.user.is_authenticated:
-            items = items.filter(
-                recipe__shopping_cart__user=request.user
+            cache_key = 'shopping_cart:{}:{}:{}'.format(
+                request.user.pk,
+                shopping.cart_version(request.user.pk),
+                renderer.format,
             )
-        else:
-            items = items.filter(
-                recipe_id__in=request.session['purchases']
+            content = cache.get(cache_key)
+            metrics.cache_result(
+                'shopping_cart',
+                hits=int(content is not None),
+                misses=int(content is None),
             )
-
-        items = items.values(
+            if content is not None:
+                return self.attachment(iter((content,)), renderer)
+            rows = ShoppingListItem.objects.filter(
+                user=request.user
+            ).order_by('-amount').values_list(
+                'ingredient__name', 'ingredient__measurement_unit', 'amount'
+            ).iterator()
+            return self.attachment(
+                self.cached(renderer.stream(rows), cache_key), renderer
+            )
+        rows = IngredientRecipe.objects.filter(
+            recipe_id__in=request.session.get('purchases', [])
+        ).values(
             'ingredient__name', 'ingredient__measurement_unit'
         ).annotate(
-            name=F('ingredient__name'),
-            units=F('ingredient__measurement_unit'),
-            total=Sum('amount'),
-        ).order_by('-total')
-
-        text = '\n'.join([
-            f"{item['name']} ({item['units']}) - {item['total']}"
-            for item in items
-        ])
-        filename = "foodgram_shopping_cart.txt"
-        response = HttpResponse(text, content_type='text/plain')
-        response['Content-Disposition'] = f'attachment; filename{filename}'
+            total=Sum('amount')
+        ).order_by('-total').values_list(
+            'ingredient__name', 'ingredient__measurement_unit', 'total'
+        )
+        return self.attachment(renderer.stream(rows.iterator()), renderer)
 
+    def attachment(self, content, renderer):
+        if isinstance(self.request._request, ASGIRequest):
+            # ASGIHandler Django 3.2 перебирает потоковый ответ в цикле
+            # событий, где запросы к БД запрещены: под ASGI файл
+            # собирается здесь, в потоке представления.
+            content = (b''.join(content),)
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type = f'{content_type}; charset={renderer.charset}'
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response['Content-Disposition'] = (
+            f'attachment; filename="{self.filename}.{renderer.format}"'
+        )
         return response
 
+    @staticmethod
+    def cached(chunks, cache_key):
+        """Отдать куски файла, сохранив его в кэш после последнего."""
+        content = []
+        for chunk in chunks:
+            content.append(chunk)
+            yield chunk
+        cache.set(
+            cache_key, b''.join(content),
+            timeout=settings.SHOPPING_CART_CACHE_TIMEOUT,
+        )
+
+
+class ProfileListView(views.APIView):
+    """Последние профили запросов (см. api.profiling)."""
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return Response(profiling.recent())
+
+
+class ProfileTokenView(views.APIView):
+    """Выдать подписанный токен для заголовка X-Profile."""
+    permission_classes = (IsAdminUser,)
+
+    def post(self, request):
+        return Response({
+            'header': profiling.HEADER,
+            'token': profiling.make_token(request.user),
+            'max_age': settings.PROFILING_TOKEN_MAX_AGE,
+        }, status=status.HTTP_201_CREATED)
+
+
+class ProfileDownloadView(views.APIView):
+    """Скачать профиль: ?file=pstats (по умолчанию) или ?file=sql."""
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request, profile_id):
+        path = profiling.path(
+            profile_id, request.query_params.get('file', 'pstats')
+        )
+        if path is None or not os.path.exists(path):
+            raise NotFound('Профиль не найден.')
+        return FileResponse(
+            open(path, 'rb'), as_attachment=True,
+            filename=os.path.basename(path),
+        )
+
 
 class UserViewSet(UserViewSet):
     """Вывод пользователей."""
     serializer_class = UserSerializer
     queryset = User.objects.all()
-    pagination_class = LimitPageNumberPagination
+    pagination_class = ApproximateCountPagination
+    recipes_limit = 3
 
     def get_serializer_class(self):
         if self.request.method.lower() == 'post':
@@ -165,28 +454,69 @@ class UserViewSet(UserViewSet):
     def perform_create(self, serializer):
         serializer.save(password=self.request.data['password'])
 
+    def with_subscription_data(self, authors):
+        """
+        Загрузить превью рецептов для страницы авторов одним оконным
+        запросом; recipes_count — столбец-счётчик автора.
+        """
+        limit = self.request.query_params.get(
+            'recipes_limit', self.recipes_limit
+        )
+        try:
+            limit = int(limit)
+        except (TypeError, ValueError):
+            raise ValidationError(
+                {'recipes_limit': 'Ожидается целое число.'}
+            )
+        previews = {author.pk: [] for author in authors}
+        if limit > 0:
+            for recipe in Recipe.objects.previews(list(previews), limit):
+                previews[recipe.author_id].append(recipe)
+        for author in authors:
+            author.preview_recipes = previews[author.pk]
+        return authors
+
+    def subscribed_authors(self):
+        return User.objects.filter(
+            following__user=self.request.user
+        ).annotate(
+            is_subscribed=Value(True, output_field=BooleanField()),
+        ).order_by('-following__created', '-id')
+
     @action(
         detail=True,
         methods=['POST', 'DELETE'],
         permission_classes=(IsAuthenticated,),
     )
     def subscribe(self, request, id):
-        return self._set_status_favorite(
-            request,
-            User,
-            Follow,
-            SubscribeSerializer
+        author = get_object_or_404(User, pk=id)
+        follow = Follow.objects.filter(user=request.user, author=author)
+        if request.method == 'DELETE':
+            if follow.delete()[0]:
+                return Response(status=status.HTTP_204_NO_CONTENT)
+            return Response({'errors': 'Вы не подписаны на этого автора!'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if author == request.user:
+            return Response({'errors': 'Нельзя подписаться на себя!'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if follow.exists():
+            return Response({'errors': 'Вы уже подписаны на этого автора!'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        Follow.objects.create(user=request.user, author=author)
+        author = self.subscribed_authors().get(pk=author.pk)
+        serializer = SubscribeSerializer(
+            self.with_subscription_data([author]),
+            many=True, context={'request': request}
         )
+        return Response(serializer.data[0], status=status.HTTP_201_CREATED)
 
     @action(
         detail=False,
         permission_classes=(IsAuthenticated,))
     def subscriptions(self, request):
         """Получить подписки пользователя."""
-
-        queryset = request.user.follower.filter(user=request.user.id)
-        pages = self.paginate_queryset(queryset)
+        pages = self.paginate_queryset(self.subscribed_authors())
         serializer = SubscribeSerializer(
-            pages, many=True,
+            self.with_subscription_data(pages), many=True,
             context={'request': request})
         return self.get_paginated_response(serializer.data)
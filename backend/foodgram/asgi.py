@@ -1,7 +1,34 @@
+import asyncio
 import os
 
+from asgiref.sync import ThreadSensitiveContext
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+os.environ.setdefault('ASYNC_VIEWS', '1')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Семафор создаётся в работающем цикле событий: в Python 3.8
+# он привязывается к циклу при создании.
+_slots = None
+
+
+async def application(scope, receive, send):
+    """
+    Django 3.2 выполняет весь синхронный код (ORM, сигналы) в одном
+    потоке на процесс. ThreadSensitiveContext даёт каждому запросу
+    свой поток, и запросы к БД разных клиентов идут параллельно.
+    Соединение с БД закрывается в конце запроса (CONN_MAX_AGE = 0),
+    поэтому потоки не оставляют открытых соединений. Одновременно
+    обрабатывается не больше ASGI_MAX_CONCURRENCY запросов, остальные
+    ждут своей очереди: так число потоков и соединений ограничено.
+    """
+    global _slots
+    if scope['type'] != 'http':
+        return await django_application(scope, receive, send)
+    if _slots is None:
+        _slots = asyncio.Semaphore(settings.ASGI_MAX_CONCURRENCY)
+    async with _slots, ThreadSensitiveContext():
+        await django_application(scope, receive, send)
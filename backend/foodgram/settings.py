@@ -34,6 +34,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
+    'api.middleware.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -81,6 +83,63 @@ else:
             'PORT': os.getenv('DB_PORT', 5432)
         }
     }
+    INSTALLED_APPS.append('django.contrib.postgres')
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'foodgram'),
+    }
+}
+
+RECIPE_CACHE_TIMEOUT = int(os.getenv('RECIPE_CACHE_TIMEOUT', 60 * 60 * 24))
+
+INGREDIENT_INDEX_TTL = int(os.getenv('INGREDIENT_INDEX_TTL', 60 * 5))
+
+SHOPPING_CART_CACHE_TIMEOUT = int(
+    os.getenv('SHOPPING_CART_CACHE_TIMEOUT', 60 * 60 * 24)
+)
+
+SHOPPING_CART_PDF_FONT = os.getenv(
+    'SHOPPING_CART_PDF_FONT',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+)
+
+PROFILING_DIR = os.getenv('PROFILING_DIR', os.path.join(BASE_DIR, 'profiles'))
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', 0))
+PROFILING_TOKEN_MAX_AGE = int(os.getenv('PROFILING_TOKEN_MAX_AGE', 60 * 60))
+# Сколько последних профилей хранить; 0 — хранить все.
+PROFILING_MAX_PROFILES = int(os.getenv('PROFILING_MAX_PROFILES', 100))
+
+# Число потоков для фоновых задач; 0 — выполнять сразу в текущем потоке.
+TASK_WORKERS = int(os.getenv('TASK_WORKERS', 2))
+
+# Копии изображения рецепта: вписываются в прямоугольник, не увеличиваясь.
+IMAGE_RENDITIONS = {
+    'card': (480, 480),
+    'detail': (1080, 1080),
+    'retina': (2160, 2160),
+}
+# AVIF кодируется, только если Pillow его поддерживает.
+IMAGE_FORMATS = ('webp', 'avif')
+IMAGE_QUALITY = int(os.getenv('IMAGE_QUALITY', 80))
+
+# Асинхронные обработчики чтения (api.async_views); foodgram.asgi
+# включает их по умолчанию, под WSGI они только добавили бы переходов
+# между потоками.
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS', '') == '1'
+# Сколько запросов процесс ASGI обрабатывает одновременно (foodgram.asgi).
+# У каждого запроса свой поток и своё соединение с БД, поэтому предел
+# на все воркеры не должен превышать max_connections PostgreSQL.
+ASGI_MAX_CONCURRENCY = int(os.getenv('ASGI_MAX_CONCURRENCY', 20))
+
+# Лента подписок (recipes.timeline): рецепты авторов, у которых рецептов
+# не меньше порога, не раскладываются подписчикам, а подмешиваются
+# при чтении.
+TIMELINE_PULL_THRESHOLD = int(os.getenv('TIMELINE_PULL_THRESHOLD', 500))
+TIMELINE_BATCH_SIZE = int(os.getenv('TIMELINE_BATCH_SIZE', 1000))
 
 AUTH_USER_MODEL = 'users.User'
 
@@ -112,6 +171,10 @@ REST_FRAMEWORK = {
     ],
 }
 
+PAGINATION_EXACT_COUNT_THRESHOLD = int(
+    os.getenv('PAGINATION_EXACT_COUNT_THRESHOLD', 10000)
+)
+
 DJOSER = {
     'LOGIN_FIELD': 'email',
     'SEND_ACTIVATION_EMAIL': False,
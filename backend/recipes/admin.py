@@ -1,7 +1,10 @@
 from django.conf import settings
 from django.contrib import admin
 from django.contrib.admin import ModelAdmin, TabularInline
+from django.db.models import Q
 
+from recipes import shopping
+from recipes.index import ingredient_index
 from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
                             Shopping, Tag)
 
@@ -18,25 +21,65 @@ class TagAdmin(admin.ModelAdmin):
 class IngredientAdmin(ModelAdmin):
     list_display = ('name', 'measurement_unit',)
     search_fields = ('name', 'measurement_unit',)
-    list_filter = ('name',)
+    list_filter = ('measurement_unit',)
+    show_full_result_count = False
     empty_value = settings.EMPTY_VALUE
 
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Поиск по названию через индекс, как в автодополнении API,
+        по единице измерения — обычным поиском админки.
+        """
+        if not search_term:
+            return queryset, False
+        return queryset.filter(
+            Q(id__in=ingredient_index.search_ids(search_term))
+            | Q(measurement_unit__icontains=search_term)
+        ), False
+
 
 class IngredientRecipeInline(TabularInline):
     model = IngredientRecipe
+    autocomplete_fields = ('ingredient',)
     min_num = 1
     extra = 1
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related(
+            'recipe', 'ingredient'
+        )
+
 
 @admin.register(Recipe)
 class RecipeAdmin(ModelAdmin):
     list_display = ('author', 'name', 'cooking_time',
                     'get_tags', 'get_ingredients', 'favorite')
-    search_fields = ('name', 'author', 'tags')
-    list_filter = ('pub_date', 'author', 'name', 'tags')
+    search_fields = ('name', 'author__username', 'tags__name')
+    list_filter = ('pub_date', 'tags')
+    list_select_related = ('author',)
+    list_per_page = 50
+    show_full_result_count = False
+    autocomplete_fields = ('author',)
     inlines = (IngredientRecipeInline,)
     empty_value = settings.EMPTY_VALUE
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related(
+            'tags', 'ingredients'
+        )
+
+    def save_model(self, request, obj, form, change):
+        obj.save(update_fields=obj.fields_to_save())
+
+    def save_related(self, request, form, formsets, change):
+        old_amounts = shopping.recipe_amounts([form.instance.pk])
+        super().save_related(request, form, formsets, change)
+        shopping.recipe_changed(
+            form.instance.pk,
+            old_amounts,
+            shopping.recipe_amounts([form.instance.pk]),
+        )
+
     def get_ingredients(self, obj):
         return ', '.join([
             ingredients.name for ingredients
@@ -45,8 +88,9 @@ class RecipeAdmin(ModelAdmin):
     get_ingredients.short_description = 'Ингридиенты'
 
     def favorite(self, obj):
-        return obj.favorite.count()
+        return obj.favorites_count
     favorite.short_description = 'Избранное'
+    favorite.admin_order_field = 'favorites_count'
 
     def get_tags(self, obj):
         list_ = [_.name for _ in obj.tags.all()]
@@ -56,14 +100,22 @@ class RecipeAdmin(ModelAdmin):
 @admin.register(Shopping)
 class ShoppingAdmin(ModelAdmin):
     list_display = ('user', 'recipe',)
+    list_select_related = ('user', 'recipe')
+    autocomplete_fields = ('user', 'recipe')
+    show_full_result_count = False
     empty_value = settings.EMPTY_VALUE
 
 
 @admin.register(Favorite)
 class FavoriteAdmin(ModelAdmin):
     list_display = ('user', 'get_recipe',)
+    list_select_related = ('user', 'recipe')
+    autocomplete_fields = ('user', 'recipe')
+    show_full_result_count = False
     empty_value = settings.EMPTY_VALUE
 
     def get_recipe(self, obj):
-        return [
-            f'{item["name"]} ' for item in obj.recipe.values('name')[:10]]
+        return obj.recipe.name
+
+    get_recipe.short_description = 'Рецепт'
+    get_recipe.admin_order_field = 'recipe__name'
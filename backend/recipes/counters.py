@@ -0,0 +1,78 @@
+"""
+Счётчики-столбцы: сколько раз рецепт добавлен в избранное, сколько
+рецептов у автора и сколько у него подписчиков.
+
+Сигналы (recipes.signals) меняют их атомарным UPDATE с F(), поэтому
+параллельные запросы не теряют изменений. rebuild() сверяет счётчики
+с таблицами и исправляет расхождения.
+"""
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from recipes.models import Favorite, Recipe
+from users.models import Follow, User
+
+BATCH_SIZE = 500
+
+# (модель, счётчик, модель строк, внешний ключ на модель)
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Follow, 'author'),
+)
+
+
+def change(model, pk, field, delta):
+    """Изменить счётчик строки на delta, не опускаясь ниже нуля."""
+    if pk is None or not delta:
+        return
+    value = F(field) + delta
+    if delta < 0:
+        value = Greatest(value, Value(0))
+    model.objects.filter(pk=pk).update(**{field: value})
+
+
+def change_many(model, pks, field, delta):
+    """То же для нескольких строк одним UPDATE."""
+    pks = list(pks)
+    if not pks or not delta:
+        return
+    value = F(field) + delta
+    if delta < 0:
+        value = Greatest(value, Value(0))
+    model.objects.filter(pk__in=pks).update(**{field: value})
+
+
+def actual_count(source, foreign_key):
+    return Coalesce(
+        Subquery(
+            source.objects.filter(
+                **{foreign_key: OuterRef('pk')}
+            ).order_by().values(foreign_key).annotate(
+                total=Count('pk')
+            ).values('total')
+        ),
+        Value(0),
+    )
+
+
+def rebuild(fix=True):
+    """
+    Сверить счётчики с таблицами. Возвращает число расходящихся
+    строк по каждому счётчику; при fix=True расхождения исправляются.
+    """
+    drift = {}
+    for model, field, source, foreign_key in COUNTERS:
+        stale = model.objects.annotate(
+            actual=actual_count(source, foreign_key)
+        ).exclude(**{field: F('actual')})
+        label = f'{model._meta.label}.{field}'
+        stale_ids = list(stale.values_list('pk', flat=True))
+        drift[label] = len(stale_ids)
+        if not fix:
+            continue
+        for start in range(0, len(stale_ids), BATCH_SIZE):
+            model.objects.filter(
+                pk__in=stale_ids[start:start + BATCH_SIZE]
+            ).update(**{field: actual_count(source, foreign_key)})
+    return drift
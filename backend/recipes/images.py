@@ -0,0 +1,124 @@
+"""
+Уменьшенные копии изображений рецептов.
+
+Оригинал сохраняется как есть в запросе, копии строятся в фоне
+(recipes.tasks): изображение поворачивается по EXIF, метаданные
+отбрасываются, каждый размер из IMAGE_RENDITIONS кодируется во все
+доступные форматы из IMAGE_FORMATS. Пути к копиям записываются
+в Recipe.renditions: {'card': {'webp': 'recipes/renditions/...'}}.
+"""
+import hashlib
+import io
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from api import cache as recipe_cache
+from recipes.models import Recipe
+
+try:
+    import pillow_avif  # noqa: F401
+except ImportError:
+    pass
+
+RENDITIONS_DIR = 'recipes/renditions'
+
+
+def available_formats():
+    Image.init()
+    return [
+        name for name in settings.IMAGE_FORMATS
+        if name.upper() in Image.SAVE
+    ]
+
+
+def rendition_paths(renditions):
+    return [
+        path
+        for files in (renditions or {}).values()
+        for path in files.values()
+    ]
+
+
+def delete_files(paths):
+    for path in paths:
+        default_storage.delete(path)
+
+
+def load(field_file):
+    """
+    Открыть оригинал и привести его к RGB/RGBA без метаданных.
+    JPEG декодируется сразу в уменьшенном виде (draft), если
+    самая крупная копия это позволяет.
+    """
+    sizes = settings.IMAGE_RENDITIONS.values()
+    largest = (max(width for width, _ in sizes),
+               max(height for _, height in sizes))
+    with field_file.open('rb'), Image.open(field_file) as source:
+        source.draft('RGB', largest)
+        image = ImageOps.exif_transpose(source)
+        has_alpha = (
+            image.mode in ('RGBA', 'LA', 'PA')
+            or 'transparency' in image.info
+        )
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+    image.info = {}
+    return image
+
+
+def encode(image, image_format):
+    buffer = io.BytesIO()
+    image.save(buffer, image_format.upper(),
+               quality=settings.IMAGE_QUALITY)
+    return buffer.getvalue()
+
+
+def render(recipe_id, field_file):
+    """Построить и сохранить копии, вернуть словарь путей."""
+    image = load(field_file)
+    digest = hashlib.md5(field_file.name.encode()).hexdigest()[:8]
+    formats = available_formats()
+    renditions = {}
+    # От крупных к мелким: каждая копия уменьшается из предыдущей.
+    for name, size in sorted(settings.IMAGE_RENDITIONS.items(),
+                             key=lambda item: item[1], reverse=True):
+        image.thumbnail(size, Image.Resampling.LANCZOS)
+        renditions[name] = {
+            image_format: default_storage.save(
+                f'{RENDITIONS_DIR}/{recipe_id}/{name}-{digest}.'
+                f'{image_format}',
+                ContentFile(encode(image, image_format)),
+            )
+            for image_format in formats
+        }
+    return renditions
+
+
+def process_recipe(recipe_id):
+    """
+    Обновить копии изображения рецепта. Запись условная: если пока
+    строились копии, изображение заменили или копии уже обновила
+    другая задача, результат выбрасывается. Так обходится без
+    блокировки строки на время кодирования.
+    """
+    recipe = Recipe.objects.only(
+        'id', 'image', 'renditions'
+    ).filter(pk=recipe_id).first()
+    if recipe is None:
+        return
+    image_name = recipe.image.name or ''
+    renditions = render(recipe.pk, recipe.image) if image_name else {}
+    updated = Recipe.objects.filter(
+        pk=recipe_id, image=image_name, renditions=recipe.renditions
+    ).update(renditions=renditions)
+    if not updated:
+        delete_files(rendition_paths(renditions))
+        return
+    # update() не отправляет сигналов, кэш рецепта сбрасывается здесь.
+    recipe_cache.invalidate_recipes([recipe_id])
+    delete_files(
+        set(rendition_paths(recipe.renditions))
+        - set(rendition_paths(renditions))
+    )
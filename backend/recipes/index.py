@@ -0,0 +1,122 @@
+"""
+Индекс ингредиентов в памяти процесса для автодополнения.
+
+Строится при первом обращении и перестраивается, когда меняется
+версия в общем кэше (её увеличивают сигналы и загрузчики) или
+истекает INGREDIENT_INDEX_TTL — так процессы без общего кэша тоже
+догоняют изменения.
+"""
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.cache import cache
+
+INDEX_VERSION_KEY = 'ingredient_index:version'
+# Совпадения из индекса уходят в базу списком id__in. SQLite до 3.32
+# принимает не больше 999 параметров, поэтому список ограничен.
+ID_LIMIT = 500
+
+
+def fold(text):
+    """Привести строку к виду для сравнения: регистр и ё/е не важны."""
+    return text.casefold().replace('ё', 'е')
+
+
+class IngredientIndex:
+    """
+    Отсортированный массив нормализованных названий.
+    Совпадения по префиксу ищутся двоичным поиском и идут первыми,
+    затем совпадения по подстроке.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = None
+        self._version = None
+        self._built_at = 0
+
+    @property
+    def state(self):
+        version = cache.get(INDEX_VERSION_KEY, 0)
+        state = self._state
+        if not self._is_fresh(version):
+            with self._lock:
+                state = self._state
+                if not self._is_fresh(version):
+                    state = self._build(version)
+        return state
+
+    def _is_fresh(self, version):
+        return (
+            self._state is not None
+            and self._version == version
+            and time.monotonic() - self._built_at
+            < settings.INGREDIENT_INDEX_TTL
+        )
+
+    def _build(self, version):
+        from recipes.models import Ingredient
+
+        ingredients = Ingredient.objects.values_list(
+            'id', 'name', 'measurement_unit', 'updated'
+        )
+        entries = sorted(
+            (fold(name), name, pk, unit, updated)
+            for pk, name, unit, updated in ingredients
+        )
+        last_modified = max(
+            (entry[4] for entry in entries), default=None
+        )
+        self._state = (
+            [entry[0] for entry in entries],
+            [
+                {'id': pk, 'name': name, 'measurement_unit': unit}
+                for _, name, pk, unit, _ in entries
+            ],
+            f'{len(entries)}:{last_modified}',
+            last_modified,
+        )
+        self._version = version
+        self._built_at = time.monotonic()
+        return self._state
+
+    @property
+    def validators(self):
+        """Маркер версии и дата изменения для условных запросов."""
+        _, _, marker, last_modified = self.state
+        return marker, last_modified
+
+    def search(self, query, limit=None):
+        keys, rows, _, _ = self.state
+        query = fold(query.strip())
+        if not query:
+            return rows[:limit]
+
+        matches = []
+        position = bisect_left(keys, query)
+        while (position < len(keys) and keys[position].startswith(query)
+               and (limit is None or len(matches) < limit)):
+            matches.append(rows[position])
+            position += 1
+        for key, row in zip(keys, rows):
+            if limit is not None and len(matches) >= limit:
+                break
+            if query in key and not key.startswith(query):
+                matches.append(row)
+        return matches
+
+    def search_ids(self, query, limit=ID_LIMIT):
+        """id первых limit совпадений для фильтра id__in."""
+        return [row['id'] for row in self.search(query, limit)]
+
+    def invalidate(self):
+        self._version = None
+        try:
+            cache.incr(INDEX_VERSION_KEY)
+        except ValueError:
+            cache.add(INDEX_VERSION_KEY, 1, timeout=None)
+
+
+ingredient_index = IngredientIndex()
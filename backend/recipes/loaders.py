@@ -0,0 +1,224 @@
+"""
+Потоковая загрузка справочников из CSV и JSON.
+
+Файл читается пачками, каждая пачка сверяется с уже существующими
+строками по ключу в памяти: новые строки вставляются через
+bulk_create(ignore_conflicts=True), изменившиеся — через bulk_update.
+Повторный запуск с тем же файлом ничего не меняет.
+"""
+import csv
+import json
+import os
+import time
+from itertools import islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+DATA_DIR = os.path.join(settings.BASE_DIR, 'recipes', 'data')
+FORMATS = ('csv', 'json')
+JSON_CHUNK_SIZE = 64 * 1024
+
+
+def iter_csv(file, fields):
+    """Строки CSV без заголовка как словари; лишние строки пропускаются."""
+    for row in csv.reader(file):
+        if len(row) == len(fields):
+            yield dict(zip(fields, row))
+        else:
+            yield None
+
+
+def iter_json(file):
+    """
+    Объекты из JSON-массива или из NDJSON (по объекту в строке)
+    без чтения всего файла в память.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    eof = False
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n[],':
+            position += 1
+        if position == len(buffer):
+            if eof:
+                return
+            buffer, position = file.read(JSON_CHUNK_SIZE), 0
+            eof = not buffer
+            continue
+        try:
+            item, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            chunk = file.read(JSON_CHUNK_SIZE)
+            if not chunk:
+                raise
+            buffer, position = buffer[position:] + chunk, 0
+            continue
+        if end == len(buffer) and not eof:
+            # Число или строка могли оборваться на границе куска.
+            chunk = file.read(JSON_CHUNK_SIZE)
+            if chunk:
+                buffer, position = buffer[position:] + chunk, 0
+                continue
+            eof = True
+        yield item if isinstance(item, dict) else None
+        position = end
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class LoadCommand(BaseCommand):
+    """
+    Основа команд загрузки справочника. Наследник задаёт модель,
+    поля ключа, обновляемые поля и файл по умолчанию.
+    """
+    model = None
+    key_fields = ()
+    update_fields = ()
+    default_path = None
+    batch_size = 1000
+
+    @property
+    def fields(self):
+        return (*self.key_fields, *self.update_fields)
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path', default=self.default_path,
+            help=f'Файл с данными (по умолчанию {self.default_path})',
+        )
+        parser.add_argument(
+            '--format', choices=FORMATS,
+            help='Формат файла, по умолчанию по расширению',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=self.batch_size,
+            help='Число строк в одной пачке',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or os.path.splitext(
+            path
+        )[1].lstrip('.').lower()
+        if file_format not in FORMATS:
+            raise CommandError(f'Неизвестный формат файла: {path}')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше нуля')
+        try:
+            file = open(path, encoding='utf-8', newline='')
+        except OSError as error:
+            raise CommandError(f'Не удалось открыть {path}: {error}')
+
+        started = time.monotonic()
+        with file:
+            rows = (
+                iter_csv(file, self.fields) if file_format == 'csv'
+                else iter_json(file)
+            )
+            try:
+                totals = self.load(rows, options['batch_size'])
+            except json.JSONDecodeError as error:
+                raise CommandError(f'Ошибка в JSON {path}: {error}')
+        if totals['created'] or totals['updated']:
+            self.loaded()
+        self.stdout.write(self.style.SUCCESS(
+            f'{self.model._meta.verbose_name_plural}: '
+            f'добавлено {totals["created"]}, '
+            f'обновлено {totals["updated"]}, '
+            f'пропущено {totals["skipped"]} '
+            f'за {time.monotonic() - started:.2f} с'
+        ))
+
+    def load(self, rows, batch_size):
+        totals = {'created': 0, 'updated': 0, 'skipped': 0}
+        for number, batch in enumerate(batched(rows, batch_size), start=1):
+            started = time.monotonic()
+            for name, value in self.load_batch(batch).items():
+                totals[name] += value
+            self.stdout.write(
+                f'Пачка {number}: добавлено {totals["created"]}, '
+                f'обновлено {totals["updated"]}, '
+                f'пропущено {totals["skipped"]} '
+                f'({time.monotonic() - started:.2f} с)'
+            )
+        return totals
+
+    def clean_row(self, row):
+        """Привести строку к значениям полей или вернуть None."""
+        if not isinstance(row, dict):
+            return None
+        values = {}
+        for name in self.fields:
+            value = str(row.get(name) or '').strip()
+            max_length = self.model._meta.get_field(name).max_length
+            if not value or (max_length and len(value) > max_length):
+                return None
+            values[name] = value
+        return values
+
+    def load_batch(self, batch):
+        rows = {}
+        skipped = 0
+        for row in map(self.clean_row, batch):
+            if row is None:
+                skipped += 1
+                continue
+            rows[tuple(row[name] for name in self.key_fields)] = row
+
+        lookup = {f'{self.key_fields[0]}__in': {key[0] for key in rows}}
+        existing = {
+            tuple(getattr(obj, name) for name in self.key_fields): obj
+            for obj in self.model.objects.filter(**lookup)
+        }
+        created, changed = [], []
+        now = timezone.now()
+        for key, row in rows.items():
+            obj = existing.get(key)
+            if obj is None:
+                created.append(self.model(**row))
+                continue
+            if any(getattr(obj, name) != row[name]
+                   for name in self.update_fields):
+                for name in self.update_fields:
+                    setattr(obj, name, row[name])
+                obj.updated = now
+                changed.append(obj)
+
+        with transaction.atomic():
+            inserted = 0
+            if created:
+                self.model.objects.bulk_create(
+                    created, ignore_conflicts=True
+                )
+                # ignore_conflicts не сообщает, какие строки пропущены
+                # (их мог вставить параллельный запуск или они нарушили
+                # другое ограничение уникальности), поэтому добавленные
+                # считаются по строкам, которые теперь есть в таблице.
+                present = {
+                    tuple(getattr(obj, name) for name in self.key_fields)
+                    for obj in self.model.objects.filter(**lookup)
+                }
+                inserted = len(present & rows.keys() - existing.keys())
+            if changed:
+                self.model.objects.bulk_update(
+                    changed, (*self.update_fields, 'updated')
+                )
+        return {
+            'created': inserted,
+            'updated': len(changed),
+            'skipped': skipped,
+        }
+
+    def loaded(self):
+        """Вызывается, если загрузка что-то изменила."""
@@ -0,0 +1,236 @@
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from recipes import counters, shopping, timeline
+from recipes.loaders import batched
+from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
+                            Shopping, Tag)
+from users.models import Follow, User
+
+WORDS = ('домашний', 'быстрый', 'праздничный', 'летний', 'острый',
+         'нежный', 'сытный', 'постный', 'по-деревенски', 'с травами')
+
+
+def power_law(size, exponent):
+    """Накопленные веса закона Ципфа: первый элемент самый популярный."""
+    return list(accumulate(1 / (rank + 1) ** exponent for rank in range(size)))
+
+
+@contextmanager
+def manual_pub_date():
+    """Разрешить задать дату публикации вместо auto_now_add."""
+    field = Recipe._meta.get_field('pub_date')
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    """
+    Генерируем воспроизводимый набор данных для нагрузочных тестов
+    на основе уже загруженных ингредиентов и тегов. Популярность
+    авторов, рецептов и ингредиентов распределена по степенному закону.
+    """
+    help = 'Генерация пользователей, рецептов, избранного, корзин, подписок'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument(
+            '--favorites', type=float, default=20,
+            help='Среднее число избранных рецептов у пользователя',
+        )
+        parser.add_argument(
+            '--follows', type=float, default=10,
+            help='Среднее число подписок у пользователя',
+        )
+        parser.add_argument(
+            '--cart', type=float, default=3,
+            help='Среднее число рецептов в корзине',
+        )
+        parser.add_argument(
+            '--exponent', type=float, default=1.1,
+            help='Показатель степенного распределения популярности',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--password', default='loadtest')
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.exponent = options['exponent']
+        self.prefix = f'load{options["seed"]}_'
+        tags = list(Tag.objects.order_by('pk').values_list('pk', flat=True))
+        ingredients = list(
+            Ingredient.objects.order_by('pk').values_list('pk', 'name')
+        )
+        if not tags or not ingredients:
+            raise CommandError(
+                'Сначала загрузите теги и ингредиенты: '
+                'load_tags, load_ingredients'
+            )
+        if User.objects.filter(username__startswith=self.prefix).exists():
+            raise CommandError(
+                f'Набор с seed={options["seed"]} уже создан, '
+                'укажите другой --seed'
+            )
+        self.random.shuffle(ingredients)
+
+        users = self.stage('Пользователи', self.create_users,
+                           options['users'], options['password'])
+        authors = users[:]
+        self.random.shuffle(authors)
+        recipes = self.stage('Рецепты', self.create_recipes,
+                             options['recipes'], authors, tags, ingredients)
+        popular = recipes[:]
+        self.random.shuffle(popular)
+        self.stage('Избранное', self.create_relations, Favorite, 'recipe',
+                   users, popular, options['favorites'])
+        self.stage('Корзины', self.create_relations, Shopping, 'recipe',
+                   users, popular, options['cart'])
+        self.stage('Подписки', self.create_relations, Follow, 'author',
+                   users, authors, options['follows'])
+        self.stage('Счётчики, списки покупок и ленты', self.rebuild)
+
+    def stage(self, title, method, *args):
+        started = time.monotonic()
+        result = method(*args)
+        self.stdout.write(self.style.SUCCESS(
+            f'{title}: {time.monotonic() - started:.2f} с'
+        ))
+        return result
+
+    def create_users(self, total, password):
+        password = make_password(password)
+        users = (
+            User(
+                username=f'{self.prefix}{number}',
+                email=f'{self.prefix}{number}@example.com',
+                first_name=f'Имя{number}',
+                last_name=f'Фамилия{number}',
+                password=password,
+            )
+            for number in range(total)
+        )
+        for batch in batched(users, self.batch_size):
+            User.objects.bulk_create(batch)
+        return list(User.objects.filter(
+            username__startswith=self.prefix
+        ).order_by('pk').values_list('pk', flat=True))
+
+    def create_recipes(self, total, authors, tags, ingredients):
+        author_weights = power_law(len(authors), self.exponent)
+        ingredient_weights = power_law(len(ingredients), self.exponent)
+        tag_weights = power_law(len(tags), self.exponent)
+        now = timezone.now()
+        recipe_ids = []
+        created = 0
+        while created < total:
+            size = min(self.batch_size, total - created)
+            compositions = [
+                self.pick(ingredients, ingredient_weights,
+                          self.random.randint(3, 12))
+                for _ in range(size)
+            ]
+            batch = [
+                Recipe(
+                    author_id=self.random.choices(
+                        authors, cum_weights=author_weights
+                    )[0],
+                    name=self.recipe_name(composition),
+                    text=', '.join(name for _, name in composition),
+                    cooking_time=self.random.randint(5, 100),
+                    pub_date=now - timedelta(
+                        seconds=self.random.randint(0, 365 * 24 * 3600)
+                    ),
+                )
+                for composition in compositions
+            ]
+            with transaction.atomic(), manual_pub_date():
+                ids = self.insert_recipes(batch)
+                IngredientRecipe.objects.bulk_create(
+                    IngredientRecipe(
+                        recipe_id=recipe_id,
+                        ingredient_id=pk,
+                        amount=self.random.randint(1, 500),
+                    )
+                    for recipe_id, composition in zip(ids, compositions)
+                    for pk, _ in composition
+                )
+                Recipe.tags.through.objects.bulk_create(
+                    Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+                    for recipe_id in ids
+                    for tag_id in self.pick(
+                        tags, tag_weights, self.random.randint(1, 3)
+                    )
+                )
+            recipe_ids.extend(ids)
+            created += size
+            self.stdout.write(f'  рецептов: {created}')
+        return recipe_ids
+
+    def insert_recipes(self, batch):
+        """
+        Вставить рецепты и вернуть их id. SQLite в Django 3.2 не
+        возвращает id из bulk_create, тогда они читаются после вставки.
+        """
+        last = Recipe.objects.order_by('-pk').values_list(
+            'pk', flat=True
+        ).first() or 0
+        Recipe.objects.bulk_create(batch)
+        if batch[0].pk is not None:
+            return [recipe.pk for recipe in batch]
+        return list(Recipe.objects.filter(pk__gt=last).order_by(
+            'pk'
+        ).values_list('pk', flat=True))
+
+    def recipe_name(self, composition):
+        main = composition[0][1]
+        return f'{main.capitalize()} {self.random.choice(WORDS)}'[:100]
+
+    def pick(self, population, cum_weights, size):
+        """Выбрать до size разных элементов с учётом весов."""
+        size = min(size, len(population))
+        chosen = {}
+        for _ in range(size * 3):
+            item = self.random.choices(population, cum_weights=cum_weights)[0]
+            chosen[item] = None
+            if len(chosen) == size:
+                break
+        return list(chosen)
+
+    def activity(self, mean):
+        """Число связей пользователя: большинство активны мало."""
+        if mean <= 0:
+            return 0
+        return int(self.random.expovariate(1 / mean))
+
+    def create_relations(self, model, target, users, targets, mean):
+        weights = power_law(len(targets), self.exponent)
+        rows = (
+            model(user_id=user_id, **{f'{target}_id': target_id})
+            for user_id in users
+            for target_id in self.pick(
+                targets, weights, self.activity(mean)
+            )
+            if target_id != user_id or target != 'author'
+        )
+        for batch in batched(rows, self.batch_size):
+            model.objects.bulk_create(batch, ignore_conflicts=True)
+
+    def rebuild(self):
+        """bulk_create обходит сигналы, поэтому агрегаты пересчитываются."""
+        counters.rebuild()
+        shopping.rebuild()
+        timeline.rebuild()
@@ -1,23 +1,20 @@
-from csv import reader
-
-from django.core.management.base import BaseCommand
+import os
 
+from recipes import shopping
+from recipes.index import ingredient_index
+from recipes.loaders import DATA_DIR, LoadCommand
 from recipes.models import Ingredient
 
 
-class Command(BaseCommand):
+class Command(LoadCommand):
     """
-    Добавляем ингредиенты из файла CSV.
+    Добавляем ингредиенты из файла CSV или JSON.
     """
     help = 'Загрузка ингредиентов'
+    model = Ingredient
+    key_fields = ('name', 'measurement_unit')
+    default_path = os.path.join(DATA_DIR, 'ingredients.csv')
 
-    def handle(self, *args, **kwargs):
-        with open(
-                'recipes/data/ingredients.csv', 'r',
-                encoding='UTF-8'
-        ) as ingredients:
-            for row in reader(ingredients):
-                if len(row) == 2:
-                    Ingredient.objects.get_or_create(
-                        name=row[0], measurement_unit=row[1],
-                    )
+    def loaded(self):
+        ingredient_index.invalidate()
+        shopping.invalidate_carts()
@@ -1,15 +1,16 @@
-from django.core.management import BaseCommand
+import os
 
+from api import cache as recipe_cache
+from recipes.loaders import DATA_DIR, LoadCommand
 from recipes.models import Tag
 
 
-class Command(BaseCommand):
+class Command(LoadCommand):
     help = 'Создаем тэги'
+    model = Tag
+    key_fields = ('slug',)
+    update_fields = ('name', 'color')
+    default_path = os.path.join(DATA_DIR, 'tags.json')
 
-    def handle(self, *args, **kwargs):
-        data = [
-            {'name': 'Завтрак', 'color': '#E26C2D', 'slug': 'breakfast'},
-            {'name': 'Обед', 'color': '#49B64E', 'slug': 'dinner'},
-            {'name': 'Ужин', 'color': '#8775D2', 'slug': 'supper'}]
-        Tag.objects.bulk_create(Tag(**tag) for tag in data)
-        self.stdout.write(self.style.SUCCESS('Теги загрузились!'))
+    def loaded(self):
+        recipe_cache.invalidate_catalogue()
@@ -0,0 +1,45 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management import BaseCommand, CommandError
+from django.db.models import Q
+
+from recipes import images, tasks
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    """
+    Строим копии изображений, которых нет: для рецептов, созданных
+    до появления копий, и для задач, потерянных при перезапуске.
+    """
+    help = 'Построение уменьшенных копий изображений рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Перестроить копии у всех рецептов с изображением',
+        )
+        parser.add_argument('--workers', type=int, default=4)
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('--workers должен быть больше нуля')
+        recipes = Recipe.objects.exclude(Q(image='') | Q(image__isnull=True))
+        if not options['all']:
+            recipes = recipes.filter(renditions={})
+        recipe_ids = list(recipes.values_list('pk', flat=True))
+        self.stdout.write(
+            f'Рецептов: {len(recipe_ids)}, форматы: '
+            f'{", ".join(images.available_formats())}'
+        )
+        started = time.monotonic()
+        with ThreadPoolExecutor(options['workers']) as pool:
+            for done, _ in enumerate(pool.map(
+                lambda pk: tasks.run(images.process_recipe, pk), recipe_ids
+            ), start=1):
+                if done % 100 == 0:
+                    self.stdout.write(f'  обработано: {done}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.monotonic() - started:.2f} с'
+        ))
@@ -0,0 +1,26 @@
+from django.core.management import BaseCommand
+
+from recipes import counters
+
+
+class Command(BaseCommand):
+    help = 'Пересчитываем счётчики избранного, рецептов и подписчиков'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только сообщить о расхождениях, не исправляя их',
+        )
+
+    def handle(self, *args, **options):
+        drift = counters.rebuild(fix=not options['check'])
+        for label, stale in drift.items():
+            style = self.style.WARNING if stale else self.style.SUCCESS
+            self.stdout.write(style(f'{label}: расхождений {stale}'))
+        if options['check'] and any(drift.values()):
+            self.stdout.write(self.style.WARNING(
+                'Запустите команду без --check, чтобы исправить счётчики.'
+            ))
+        elif any(drift.values()):
+            self.stdout.write(self.style.SUCCESS('Счётчики исправлены!'))
@@ -0,0 +1,21 @@
+from django.core.management import BaseCommand
+
+from recipes import timeline
+
+
+class Command(BaseCommand):
+    help = 'Пересобираем ленты подписок'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Сколько подписчиков пересобирать в одной транзакции',
+        )
+
+    def handle(self, *args, **options):
+        total = timeline.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Ленты пересобраны, записей: {total}'
+        ))
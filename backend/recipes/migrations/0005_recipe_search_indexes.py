@@ -0,0 +1,53 @@
+from django.db import migrations
+
+SEARCH_INDEX = 'recipe_search_vector_idx'
+TRIGRAM_INDEX = 'recipe_name_trgm_idx'
+
+
+def search_indexes():
+    from django.contrib.postgres.indexes import GinIndex
+    from django.contrib.postgres.search import SearchVector
+
+    return (
+        GinIndex(
+            SearchVector('name', 'text', config='russian'),
+            name=SEARCH_INDEX,
+        ),
+        GinIndex(
+            fields=['name'],
+            name=TRIGRAM_INDEX,
+            opclasses=['gin_trgm_ops'],
+        ),
+    )
+
+
+def create_search_indexes(apps, schema_editor):
+    """
+    GIN-индексы есть только в PostgreSQL; для SQLite таблицу FTS5
+    создаёт обработчик post_migrate (recipes.signals).
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    recipe = apps.get_model('recipes', 'Recipe')
+    for index in search_indexes():
+        schema_editor.add_index(recipe, index)
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    recipe = apps.get_model('recipes', 'Recipe')
+    for index in search_indexes():
+        schema_editor.remove_index(recipe, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_updated_timestamps'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
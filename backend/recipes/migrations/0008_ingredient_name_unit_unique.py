@@ -0,0 +1,52 @@
+# Generated by Django 3.2.16 on 2026-10-18 04:53
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicates(apps, schema_editor):
+    """
+    Перед добавлением ограничения сливаем дубли ингредиентов в самый
+    ранний: ссылки переносятся, количества одного ингредиента
+    в рецепте и в списке покупок складываются.
+    """
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    IngredientRecipe = apps.get_model('recipes', 'IngredientRecipe')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    groups = Ingredient.objects.values(
+        'name', 'measurement_unit'
+    ).annotate(keep=Min('id'), total=Count('id')).filter(total__gt=1)
+    for group in groups:
+        duplicates = Ingredient.objects.filter(
+            name=group['name'], measurement_unit=group['measurement_unit'],
+        ).exclude(id=group['keep'])
+        for model, owner in ((IngredientRecipe, 'recipe_id'),
+                             (ShoppingListItem, 'user_id')):
+            for row in model.objects.filter(ingredient__in=duplicates):
+                kept = model.objects.filter(
+                    ingredient_id=group['keep'],
+                    **{owner: getattr(row, owner)},
+                ).first()
+                if kept is None:
+                    row.ingredient_id = group['keep']
+                    row.save(update_fields=['ingredient'])
+                else:
+                    kept.amount += row.amount
+                    kept.save(update_fields=['amount'])
+                    row.delete()
+        duplicates.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_recipe_favorites_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='ingredient_name_unit_unique'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.16 on 2026-10-18 05:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_ingredient_name_unit_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Пути к копиям по размерам и форматам, см. recipes.images', verbose_name='Уменьшенные копии изображения'),
+        ),
+    ]
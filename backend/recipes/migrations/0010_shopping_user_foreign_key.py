@@ -0,0 +1,21 @@
+# Generated by Django 3.2.16 on 2026-10-18 05:08
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0009_recipe_renditions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='shopping',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_cart', to=settings.AUTH_USER_MODEL, verbose_name='users'),
+        ),
+    ]
@@ -1,7 +1,8 @@
 from django.contrib.auth import get_user_model
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
-from django.db.models import CASCADE, UniqueConstraint
+from django.db.models import CASCADE, F, Prefetch, UniqueConstraint, Window
+from django.db.models.functions import RowNumber
 
 User = get_user_model()
 
@@ -25,6 +26,10 @@ class Tag(models.Model):
         max_length=100,
         unique=True
     )
+    updated = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения',
+    )
 
     class Meta:
         ordering = ('name',)
@@ -49,16 +54,88 @@ class Ingredient(models.Model):
         max_length=100,
         help_text='Выберите единицу измерения',
     )
+    updated = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения',
+    )
 
     class Meta:
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингридиенты'
         ordering = ('name',)
+        constraints = [
+            UniqueConstraint(
+                fields=('name', 'measurement_unit'),
+                name='ingredient_name_unit_unique',
+            )
+        ]
 
     def __str__(self):
         return f'{self.name}, {self.measurement_unit}.'
 
 
+class RecipeQuerySet(models.QuerySet):
+    """
+    Выборки рецептов для ленты: автор присоединяется в том же
+    запросе, связанные объекты подгружаются пачкой.
+    """
+
+    @staticmethod
+    def prefetch_lookups():
+        return (
+            'tags',
+            Prefetch(
+                'recipe_to_ingredient',
+                queryset=IngredientRecipe.objects.select_related(
+                    'ingredient'
+                ),
+            ),
+        )
+
+    def with_relations(self):
+        return self.select_related('author').prefetch_related(
+            *self.prefetch_lookups()
+        )
+
+    def search(self, query):
+        """Поиск с аннотацией search_rank, см. recipes.search."""
+        from recipes.search import search_recipes
+
+        return search_recipes(self, query)
+
+    def feed(self):
+        """
+        Теги и ингредиенты не загружаются: RecipeReadSerializer
+        подгружает их только для рецептов, которых нет в кэше,
+        а флаги пользователя берёт из api.relations.
+        """
+        return self.select_related('author')
+
+    def previews(self, author_ids, limit):
+        """
+        Последние limit рецептов каждого автора одним запросом.
+        Django 3.2 не умеет фильтровать по оконной функции, поэтому
+        запрос с ROW_NUMBER() оборачивается во внешний SELECT.
+        """
+        if not author_ids:
+            return self.none()
+        ranked = self.filter(author_id__in=author_ids).annotate(
+            preview_number=Window(
+                RowNumber(),
+                partition_by=F('author_id'),
+                order_by=(F('pub_date').desc(), F('id').desc()),
+            ),
+        ).only(
+            'id', 'name', 'image', 'renditions', 'cooking_time', 'author_id'
+        ).order_by()
+        sql, params = ranked.query.get_compiler(self.db).as_sql()
+        return self.raw(
+            f'SELECT * FROM ({sql}) previews WHERE preview_number <= %s '
+            'ORDER BY author_id, preview_number',
+            (*params, limit),
+        )
+
+
 class Recipe(models.Model):
     """
     Модель приложения рецепта, описываем:
@@ -98,6 +175,13 @@ class Recipe(models.Model):
         blank=True,
         help_text='Изображение с фотографией блюда',
     )
+    renditions = models.JSONField(
+        verbose_name='Уменьшенные копии изображения',
+        default=dict,
+        blank=True,
+        editable=False,
+        help_text='Пути к копиям по размерам и форматам, см. recipes.images',
+    )
     text = models.TextField(
         verbose_name='Описание блюда',
         max_length=250,
@@ -106,6 +190,10 @@ class Recipe(models.Model):
         auto_now_add=True,
         verbose_name='Дата публикации'
     )
+    updated = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения',
+    )
     cooking_time = models.PositiveSmallIntegerField(
         verbose_name='Время приготовления',
         default=0,
@@ -121,10 +209,67 @@ class Recipe(models.Model):
         ),
     )
 
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='В избранном',
+        default=0,
+        editable=False,
+        db_index=True,
+    )
+
+    objects = RecipeQuerySet.as_manager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Запоминаем автора и изображение, чтобы сигналы заметили смену."""
+        instance = super().from_db(db, field_names, values)
+        if 'author_id' in instance.__dict__:
+            instance._loaded_author_id = instance.author_id
+        if 'image' in instance.__dict__:
+            instance._loaded_image = instance.image.name or ''
+        return instance
+
+    def image_changed(self):
+        """Изображение заменено после загрузки из БД или ещё не сохранено."""
+        if 'image' not in self.__dict__:
+            return False
+        return (
+            not self.image._committed
+            or (self.image.name or '') != getattr(self, '_loaded_image', '')
+        )
+
+    def fields_to_save(self):
+        """
+        update_fields для правки рецепта через API и админку. Копии
+        изображения пишет фоновая задача (recipes.images), поэтому,
+        пока изображение не заменено, renditions не сохраняется:
+        значение, загруженное до окончания задачи, затёрло бы готовые
+        копии. None — сохранить все поля (новый рецепт, новое
+        изображение).
+        """
+        if self._state.adding or self.image_changed():
+            return None
+        deferred = self.get_deferred_fields()
+        return [
+            field.name for field in self._meta.concrete_fields
+            if not field.primary_key
+            and field.name != 'renditions'
+            and field.attname not in deferred
+        ]
+
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date',)
+        indexes = (
+            models.Index(
+                fields=('-pub_date', '-id'),
+                name='recipe_pub_date_id_idx',
+            ),
+            models.Index(
+                fields=('author', '-pub_date', '-id'),
+                name='recipe_author_pub_date_idx',
+            ),
+        )
 
     def __str__(self):
         return self.name
@@ -252,7 +397,7 @@ class Shopping(models.Model):
         related_name='shopping_cart',
         on_delete=CASCADE,
     )
-    user = models.OneToOneField(
+    user = models.ForeignKey(
         User,
         verbose_name='users',
         related_name='shopping_cart',
@@ -272,3 +417,82 @@ class Shopping(models.Model):
 
     def __str__(self):
         return f'{self.user} добавил "{self.recipe}" в Список покупок'
+
+
+class ShoppingListItem(models.Model):
+    """
+    Сводный список покупок: сколько ингредиента нужно пользователю
+    по всем рецептам в корзине. Поддерживается при изменении корзины
+    и состава рецептов, см. recipes.shopping.
+    """
+    user = models.ForeignKey(
+        User,
+        verbose_name='Пользователь',
+        related_name='shopping_list',
+        on_delete=CASCADE,
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        verbose_name='Ингредиент',
+        related_name='shopping_list_items',
+        on_delete=CASCADE,
+    )
+    amount = models.PositiveIntegerField(
+        verbose_name='Количество',
+        default=0,
+    )
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Сводные списки покупок'
+        constraints = [
+            UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='shopping_list_user_ingredient_unique'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user}: {self.ingredient.name}, {self.amount}'
+
+
+class TimelineEntry(models.Model):
+    """
+    Рецепт в ленте подписок пользователя. Строки раскладываются
+    подписчикам при публикации (recipes.timeline); дата публикации
+    повторена здесь, чтобы страница ленты читалась по одному индексу.
+    """
+    user = models.ForeignKey(
+        User,
+        verbose_name='Подписчик',
+        related_name='timeline',
+        on_delete=CASCADE,
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        verbose_name='Рецепт',
+        related_name='timeline_entries',
+        on_delete=CASCADE,
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации',
+    )
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Ленты подписок'
+        constraints = [
+            UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='timeline_user_recipe_unique'
+            )
+        ]
+        indexes = (
+            models.Index(
+                fields=('user', '-pub_date', '-recipe'),
+                name='timeline_user_pub_date_idx',
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.user}: {self.recipe_id}'
@@ -0,0 +1,136 @@
+"""
+Полнотекстовый поиск рецептов по названию и описанию.
+
+PostgreSQL: полнотекстовый поиск с русской конфигурацией и триграммное
+сходство названия, оба по GIN-индексам (миграция 0005).
+SQLite: таблица FTS5 с копией названий и описаний, где ё заменена
+на е, её поддерживают триггеры. Таблица и триггеры создаются после
+migrate: SQLite пересоздаёт таблицу рецептов при изменении схемы,
+и триггеры при этом теряются.
+"""
+import re
+
+from django.db import connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+SEARCH_CONFIG = 'russian'
+FTS_TABLE = 'recipes_recipe_fts'
+
+
+def _sqlite_fold(column):
+    return f"replace(replace({column}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+SQLITE_FTS_TABLE_SQL = (
+    f'CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5('
+    "name, text, tokenize='unicode61 remove_diacritics 2')"
+)
+SQLITE_FTS_FILL_SQL = (
+    f'INSERT INTO {FTS_TABLE}(rowid, name, text) '
+    f'SELECT id, {_sqlite_fold("name")}, {_sqlite_fold("text")} '
+    'FROM recipes_recipe'
+)
+SQLITE_FTS_TRIGGERS_SQL = (
+    f'CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai '
+    'AFTER INSERT ON recipes_recipe BEGIN '
+    f'INSERT INTO {FTS_TABLE}(rowid, name, text) VALUES (new.id, '
+    f'{_sqlite_fold("new.name")}, {_sqlite_fold("new.text")}); END',
+
+    f'CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad '
+    'AFTER DELETE ON recipes_recipe BEGIN '
+    f'DELETE FROM {FTS_TABLE} WHERE rowid = old.id; END',
+
+    f'CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au '
+    'AFTER UPDATE OF name, text ON recipes_recipe BEGIN '
+    f'UPDATE {FTS_TABLE} SET name = {_sqlite_fold("new.name")}, '
+    f'text = {_sqlite_fold("new.text")} WHERE rowid = new.id; END',
+)
+
+
+def search_terms(query):
+    return re.findall(r'\w+', query.lower())
+
+
+def ensure_sqlite_fts(connection):
+    """Создать таблицу FTS5 и триггеры, если их нет."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        tables = connection.introspection.table_names(cursor)
+        if 'recipes_recipe' not in tables:
+            return
+        if FTS_TABLE not in tables:
+            cursor.execute(SQLITE_FTS_TABLE_SQL)
+            cursor.execute(SQLITE_FTS_FILL_SQL)
+        for sql in SQLITE_FTS_TRIGGERS_SQL:
+            cursor.execute(sql)
+
+
+def search_recipes(queryset, query):
+    """
+    Отфильтровать рецепты по запросу и аннотировать search_rank:
+    чем больше, тем релевантнее. Последнее слово запроса ищется
+    как префикс, чтобы поиск работал по мере набора. Запрос без
+    единого слова (например, только знаки препинания) ничего
+    не находит.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return queryset.none().annotate(search_rank=RawSQL('0', ()))
+    vendor = connections[queryset.db].vendor
+    if vendor == 'postgresql':
+        return _search_postgresql(queryset, query, terms)
+    if vendor == 'sqlite':
+        return _search_sqlite(queryset, terms)
+    condition = Q()
+    for term in terms:
+        condition &= Q(name__icontains=term) | Q(text__icontains=term)
+    return queryset.filter(condition).annotate(
+        search_rank=RawSQL('0', ())
+    )
+
+
+def _search_postgresql(queryset, query, terms):
+    from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                                SearchVector,
+                                                TrigramSimilarity)
+
+    search_query = SearchQuery(
+        ' & '.join(f'{term}:*' for term in terms),
+        config=SEARCH_CONFIG,
+        search_type='raw',
+    )
+    weighted_vector = (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector('text', weight='B', config=SEARCH_CONFIG)
+    )
+    return queryset.annotate(
+        search_vector=SearchVector('name', 'text', config=SEARCH_CONFIG),
+    ).filter(
+        Q(search_vector=search_query) | Q(name__trigram_similar=query)
+    ).annotate(
+        search_rank=(
+            SearchRank(weighted_vector, search_query)
+            + TrigramSimilarity('name', query)
+        ),
+    )
+
+
+def _search_sqlite(queryset, terms):
+    match = ' '.join(
+        '"{}"*'.format(term.replace('ё', 'е')) for term in terms
+    )
+    table = queryset.model._meta.db_table
+    return queryset.filter(
+        id__in=RawSQL(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+            (match,),
+        )
+    ).annotate(
+        search_rank=RawSQL(
+            f'SELECT -bm25({FTS_TABLE}, 10.0, 1.0) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND rowid = "{table}"."id"',
+            (match,),
+        )
+    )
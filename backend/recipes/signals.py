@@ -0,0 +1,117 @@
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models.signals import (post_delete, post_migrate, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+
+from recipes import counters, shopping, tasks, timeline
+from recipes.index import ingredient_index
+from recipes.models import Favorite, Ingredient, Recipe, Shopping
+from recipes.search import ensure_sqlite_fts
+from users.models import Follow, User
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+def ingredient_changed(sender, **kwargs):
+    transaction.on_commit(ingredient_index.invalidate)
+    # Названия и единицы ингредиентов есть в готовых выгрузках корзин.
+    transaction.on_commit(shopping.invalidate_carts)
+
+
+@receiver(post_migrate)
+def create_search_tables(sender, using, **kwargs):
+    if sender.name == 'recipes':
+        ensure_sqlite_fts(connections[using])
+
+
+@receiver(post_save, sender=Shopping)
+def recipe_added_to_cart(sender, instance, created, **kwargs):
+    if created:
+        shopping.add_recipes(instance.user_id, [instance.recipe_id])
+
+
+@receiver(pre_delete, sender=Shopping)
+def recipe_removed_from_cart(sender, instance, **kwargs):
+    """
+    pre_delete, а не post_delete: при каскадном удалении рецепта
+    его ингредиенты ещё на месте и количество можно вычесть.
+    """
+    shopping.remove_recipes(instance.user_id, [instance.recipe_id])
+
+
+@receiver(post_save, sender=Favorite)
+def favorite_added(sender, instance, created, **kwargs):
+    if created:
+        counters.change(Recipe, instance.recipe_id, 'favorites_count', 1)
+
+
+@receiver(post_delete, sender=Favorite)
+def favorite_removed(sender, instance, **kwargs):
+    counters.change(Recipe, instance.recipe_id, 'favorites_count', -1)
+
+
+@receiver(pre_save, sender=Recipe)
+def recipe_image_replaced(sender, instance, **kwargs):
+    """
+    При замене изображения старые копии удаляются, новые строятся
+    в фоне после сохранения.
+    """
+    instance._image_changed = instance.image_changed()
+    if instance._image_changed and instance.renditions:
+        tasks.delete_renditions(instance.renditions)
+        instance.renditions = {}
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, created, **kwargs):
+    """Автор и изображение запоминаются в Recipe.from_db."""
+    if getattr(instance, '_image_changed', False):
+        instance._image_changed = False
+        instance._loaded_image = instance.image.name or ''
+        tasks.process_images([instance.pk])
+    if created:
+        counters.change(User, instance.author_id, 'recipes_count', 1)
+        tasks.fan_out([instance.pk])
+    elif hasattr(instance, '_loaded_author_id'):
+        old_author_id = instance._loaded_author_id
+        if old_author_id != instance.author_id:
+            counters.change(User, old_author_id, 'recipes_count', -1)
+            counters.change(User, instance.author_id, 'recipes_count', 1)
+            # Записи у подписчиков прежнего автора скрываются при чтении.
+            tasks.fan_out([instance.pk])
+            author_left_pull(old_author_id)
+    if 'author_id' in instance.__dict__:
+        instance._loaded_author_id = instance.author_id
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    counters.change(User, instance.author_id, 'recipes_count', -1)
+    tasks.delete_renditions(instance.renditions)
+    author_left_pull(instance.author_id)
+
+
+def author_left_pull(author_id):
+    """
+    Рецепты удаляются по одному, и ровно одно удаление видит счётчик
+    на единицу ниже порога. Тогда автор перестаёт подмешиваться
+    при чтении, и его рецепты раздаются подписчикам.
+    """
+    if author_id is not None and User.objects.filter(
+        pk=author_id,
+        recipes_count=settings.TIMELINE_PULL_THRESHOLD - 1,
+    ).exists():
+        tasks.fan_out_author(author_id)
+
+
+@receiver(post_save, sender=Follow)
+def follow_added(sender, instance, created, **kwargs):
+    if created:
+        counters.change(User, instance.author_id, 'followers_count', 1)
+        tasks.backfill_timeline(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_removed(sender, instance, **kwargs):
+    counters.change(User, instance.author_id, 'followers_count', -1)
+    timeline.remove_author(instance.user_id, instance.author_id)
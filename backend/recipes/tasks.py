@@ -0,0 +1,85 @@
+"""
+Фоновые задачи в пуле потоков процесса.
+
+Задачи ставятся после фиксации транзакции, чтобы поток увидел
+сохранённые данные. Пул создаётся лениво: после форка gunicorn
+у каждого воркера он свой. Задачи, потерянные при остановке
+процесса, досчитываются командами (например, process_images).
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from recipes import images, timeline
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.TASK_WORKERS,
+                thread_name_prefix='foodgram-task',
+            )
+    return _executor
+
+
+def call(func, *args):
+    """Выполнить задачу, записав ошибку в журнал вместо исключения."""
+    try:
+        return func(*args)
+    except Exception:
+        logger.exception('Фоновая задача %s завершилась ошибкой',
+                         func.__name__)
+        return None
+
+
+def run(func, *args):
+    """Выполнить задачу в потоке пула и закрыть его соединение с БД."""
+    try:
+        return call(func, *args)
+    finally:
+        connection.close()
+
+
+def submit(func, *args):
+    if settings.TASK_WORKERS < 1:
+        return call(func, *args)
+    return get_executor().submit(run, func, *args)
+
+
+def submit_on_commit(func, *args):
+    transaction.on_commit(lambda: submit(func, *args))
+
+
+def process_images(recipe_ids):
+    for pk in recipe_ids:
+        submit_on_commit(images.process_recipe, pk)
+
+
+def delete_renditions(renditions):
+    paths = images.rendition_paths(renditions)
+    if paths:
+        submit_on_commit(images.delete_files, paths)
+
+
+def fan_out(recipe_ids):
+    recipe_ids = list(recipe_ids)
+    if recipe_ids:
+        submit_on_commit(timeline.fan_out, recipe_ids)
+
+
+def fan_out_author(author_id):
+    submit_on_commit(timeline.fan_out_author, author_id)
+
+
+def backfill_timeline(user_id, author_id):
+    submit_on_commit(timeline.backfill, user_id, author_id)
@@ -0,0 +1,198 @@
+"""
+Лента подписок: рецепты авторов, на которых подписан пользователь.
+
+Гибрид раздачи и выборки. Рецепт автора с числом рецептов меньше
+TIMELINE_PULL_THRESHOLD при публикации раскладывается в TimelineEntry
+всех подписчиков — пачками в фоне (recipes.tasks). Рецепты более
+плодовитых авторов не раскладываются: при чтении они выбираются
+из Recipe и сливаются с лентой по (pub_date, id). Порог ограничивает
+и размер ленты, и объём заполнения при подписке.
+
+Сигналы (recipes.signals) раздают новые рецепты, заполняют ленту
+при подписке и чистят её при отписке. bulk_create и сырые запросы
+сигналов не отправляют: импорт вызывает раздачу сам, а rebuild()
+пересобирает ленты целиком (команда rebuild_timelines).
+"""
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+
+from recipes.models import Recipe, TimelineEntry
+from users.models import Follow, User
+
+
+def keyset(queryset, position, id_field='id'):
+    """
+    Отфильтровать и упорядочить выборку для keyset-пагинации
+    по (pub_date, id). position — (reverse, pub_date, pk) из курсора
+    или None для первой страницы; reverse обходит в обратную сторону.
+    """
+    if position is None:
+        return queryset.order_by('-pub_date', f'-{id_field}')
+    reverse, pub_date, pk = position
+    if reverse:
+        return queryset.filter(
+            Q(pub_date__gt=pub_date)
+            | Q(pub_date=pub_date, **{f'{id_field}__gt': pk})
+        ).order_by('pub_date', id_field)
+    return queryset.filter(
+        Q(pub_date__lt=pub_date)
+        | Q(pub_date=pub_date, **{f'{id_field}__lt': pk})
+    ).order_by('-pub_date', f'-{id_field}')
+
+
+def pulled_authors():
+    """Авторы, чьи рецепты подмешиваются при чтении."""
+    return User.objects.filter(
+        recipes_count__gte=settings.TIMELINE_PULL_THRESHOLD
+    )
+
+
+class Timeline:
+    """Лента пользователя для TimelinePagination."""
+
+    def __init__(self, user):
+        self.user = user
+
+    def page(self, position, limit):
+        """
+        До limit рецептов после position в порядке обхода. Разложенные
+        записи и рецепты плодовитых авторов читаются двумя запросами
+        по limit строк и сливаются; рецепт, попавший в оба источника
+        (автор перешёл порог), берётся один раз. Записи авторов,
+        от которых пользователь уже отписался, не показываются.
+        """
+        entries = keyset(
+            TimelineEntry.objects.filter(
+                user=self.user,
+                recipe__author__following__user=self.user,
+            ).select_related('recipe__author'),
+            position, id_field='recipe_id',
+        )[:limit]
+        pulled = keyset(
+            Recipe.objects.feed().filter(
+                author__in=pulled_authors().filter(
+                    following__user=self.user
+                ),
+            ),
+            position,
+        )[:limit]
+        recipes = {entry.recipe.pk: entry.recipe for entry in entries}
+        recipes.update((recipe.pk, recipe) for recipe in pulled)
+        backwards = position is not None and position[0]
+        return sorted(
+            recipes.values(),
+            key=lambda recipe: (recipe.pub_date, recipe.pk),
+            reverse=not backwards,
+        )[:limit]
+
+
+def insert(rows):
+    TimelineEntry.objects.bulk_create(
+        (
+            TimelineEntry(user_id=user_id, recipe_id=recipe_id,
+                          pub_date=pub_date)
+            for user_id, recipe_id, pub_date in rows
+        ),
+        batch_size=settings.TIMELINE_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def fan_out(recipe_ids):
+    """
+    Разложить рецепты по лентам подписчиков их авторов. Подписчики
+    читаются пачками по id, каждая пачка вставляется отдельно,
+    так что длинная раздача не держит транзакцию.
+    """
+    recipes = {}
+    for pk, author_id, pub_date in Recipe.objects.filter(
+        pk__in=recipe_ids,
+        author__recipes_count__lt=settings.TIMELINE_PULL_THRESHOLD,
+    ).values_list('pk', 'author_id', 'pub_date'):
+        recipes.setdefault(author_id, []).append((pk, pub_date))
+    batch_size = settings.TIMELINE_BATCH_SIZE
+    for author_id, items in recipes.items():
+        followers = Follow.objects.filter(
+            author_id=author_id
+        ).order_by('user_id').values_list('user_id', flat=True)
+        last_id = 0
+        while True:
+            user_ids = list(followers.filter(
+                user_id__gt=last_id
+            )[:max(1, batch_size // len(items))])
+            if not user_ids:
+                break
+            insert(
+                (user_id, pk, pub_date)
+                for user_id in user_ids for pk, pub_date in items
+            )
+            last_id = user_ids[-1]
+
+
+def fan_out_author(author_id):
+    """Автор опустился ниже порога: его рецепты снова раздаются."""
+    fan_out(list(
+        Recipe.objects.filter(author_id=author_id).values_list(
+            'pk', flat=True
+        )
+    ))
+
+
+def backfill(user_id, author_id):
+    """
+    Заполнить ленту рецептами автора после подписки. Плодовитые
+    авторы подмешиваются при чтении и не заполняются; отписка,
+    случившаяся раньше задачи, тоже отменяет заполнение.
+    """
+    insert(
+        (user_id, pk, pub_date)
+        for pk, pub_date in Recipe.objects.filter(
+            author_id=author_id,
+            author__recipes_count__lt=settings.TIMELINE_PULL_THRESHOLD,
+            author__following__user_id=user_id,
+        ).values_list('pk', 'pub_date')
+    )
+
+
+def remove_author(user_id, author_id):
+    """Убрать рецепты автора из ленты после отписки."""
+    TimelineEntry.objects.filter(
+        user_id=user_id, recipe__author_id=author_id
+    ).delete()
+
+
+def rebuild(batch_size=500):
+    """
+    Пересобрать все ленты: для каждой пачки подписчиков записи
+    удаляются и вставляются заново одним INSERT ... SELECT из подписок.
+    Возвращает число записей после пересборки.
+    """
+    quote = connection.ops.quote_name
+    user_ids = list(
+        Follow.objects.order_by('user_id').values_list(
+            'user_id', flat=True
+        ).distinct()
+    )
+    TimelineEntry.objects.exclude(user_id__in=Follow.objects.values(
+        'user_id'
+    )).delete()
+    for start in range(0, len(user_ids), batch_size):
+        batch = user_ids[start:start + batch_size]
+        placeholders = ', '.join(['%s'] * len(batch))
+        with transaction.atomic(), connection.cursor() as cursor:
+            TimelineEntry.objects.filter(user_id__in=batch).delete()
+            cursor.execute(
+                f'INSERT INTO {quote(TimelineEntry._meta.db_table)} '
+                '(user_id, recipe_id, pub_date) '
+                'SELECT f.user_id, r.id, r.pub_date '
+                f'FROM {quote(Follow._meta.db_table)} f '
+                f'JOIN {quote(Recipe._meta.db_table)} r '
+                'ON r.author_id = f.author_id '
+                f'JOIN {quote(User._meta.db_table)} u '
+                'ON u.id = f.author_id '
+                f'WHERE f.user_id IN ({placeholders}) '
+                'AND u.recipes_count < %s',
+                [*batch, settings.TIMELINE_PULL_THRESHOLD],
+            )
+    return TimelineEntry.objects.count()
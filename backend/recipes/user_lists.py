@@ -0,0 +1,114 @@
+"""
+Избранное и корзина: добавление и удаление рецептов пачкой.
+
+Каждая операция — один SQL-запрос: INSERT ... SELECT ... ON CONFLICT
+DO NOTHING RETURNING вставляет только существующие и ещё не добавленные
+рецепты, DELETE ... RETURNING удаляет только добавленные. RETURNING
+точно говорит, что изменилось, даже при параллельных запросах,
+поэтому счётчики избранного и сводный список покупок меняются ровно
+на эти рецепты. Нужен PostgreSQL или SQLite 3.35+.
+
+Запросы обходят сигналы моделей, счётчики и список покупок
+обновляются здесь же.
+"""
+from django.db import connection, transaction
+
+from recipes import counters, shopping
+from recipes.models import Favorite, IngredientRecipe, Recipe, Shopping
+
+# Поля короткой карточки рецепта (ShortRecipeShoppingSerializer).
+CARD_FIELDS = ('id', 'name', 'image', 'renditions', 'cooking_time')
+
+
+def _placeholders(values):
+    return ', '.join(['%s'] * len(values))
+
+
+def _insert(cursor, model, user_id, recipe_ids):
+    quote = connection.ops.quote_name
+    cursor.execute(
+        f'INSERT INTO {quote(model._meta.db_table)} '
+        '(user_id, recipe_id) '
+        f'SELECT %s, id FROM {quote(Recipe._meta.db_table)} '
+        f'WHERE id IN ({_placeholders(recipe_ids)}) '
+        'ON CONFLICT DO NOTHING RETURNING recipe_id',
+        [user_id, *recipe_ids],
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def add(model, user_id, recipe_ids):
+    """Добавить рецепты; вернуть id действительно добавленных."""
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return []
+    with transaction.atomic(), connection.cursor() as cursor:
+        added = _insert(cursor, model, user_id, recipe_ids)
+        if model is Favorite:
+            counters.change_many(Recipe, added, 'favorites_count', 1)
+        elif model is Shopping and added:
+            shopping.add_recipes(user_id, added)
+    return added
+
+
+def add_card(model, user_id, recipe_id):
+    """
+    Добавить один рецепт и вернуть его карточку (Recipe с полями
+    CARD_FIELDS) или None, если рецепт уже добавлен или его нет.
+    Отдельного чтения рецепта нет: для избранного карточку возвращает
+    UPDATE счётчика, для корзины — тот же SELECT, что суммирует
+    ингредиенты рецепта для списка покупок.
+    """
+    quote = connection.ops.quote_name
+    recipe_table = quote(Recipe._meta.db_table)
+    columns = ', '.join(
+        f'{recipe_table}.{quote(Recipe._meta.get_field(name).column)}'
+        for name in CARD_FIELDS
+    )
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            if not _insert(cursor, model, user_id, [recipe_id]):
+                return None
+        if model is Favorite:
+            return next(iter(Recipe.objects.raw(
+                f'UPDATE {recipe_table} SET favorites_count = '
+                'favorites_count + 1 WHERE id = %s '
+                f'RETURNING {columns}',
+                [recipe_id],
+            )))
+        ingredients = quote(IngredientRecipe._meta.db_table)
+        rows = list(Recipe.objects.raw(
+            f'SELECT {columns}, {ingredients}.ingredient_id, '
+            f'SUM({ingredients}.amount) AS total '
+            f'FROM {recipe_table} LEFT JOIN {ingredients} '
+            f'ON {ingredients}.recipe_id = {recipe_table}.id '
+            f'WHERE {recipe_table}.id = %s '
+            f'GROUP BY {recipe_table}.id, {ingredients}.ingredient_id',
+            [recipe_id],
+        ))
+        shopping.apply_deltas([user_id], {
+            row.ingredient_id: row.total for row in rows
+            if row.ingredient_id is not None
+        })
+    return rows[0]
+
+
+def remove(model, user_id, recipe_ids):
+    """Удалить рецепты; вернуть id действительно удалённых."""
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return []
+    quote = connection.ops.quote_name
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {quote(model._meta.db_table)} '
+            f'WHERE user_id = %s AND recipe_id IN '
+            f'({_placeholders(recipe_ids)}) RETURNING recipe_id',
+            [user_id, *recipe_ids],
+        )
+        removed = [row[0] for row in cursor.fetchall()]
+        if model is Favorite:
+            counters.change_many(Recipe, removed, 'favorites_count', -1)
+        elif model is Shopping and removed:
+            shopping.remove_recipes(user_id, removed)
+    return removed
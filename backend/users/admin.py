@@ -10,14 +10,19 @@ User = get_user_model()
 
 @admin.register(User)
 class UserAdmin(ModelAdmin):
-    list_display = ('username', 'email', 'password', 'first_name')
-    list_filter = ('first_name', 'email',)
+    list_display = ('username', 'email', 'password', 'first_name',
+                    'recipes_count', 'followers_count')
+    list_filter = ('is_staff', 'is_active')
     search_fields = ('username', 'email',)
+    show_full_result_count = False
     empty_value = settings.EMPTY_VALUE
 
 
 @register(Follow)
 class FollowAdmin(ModelAdmin):
     list_display = ('user', 'author', 'created',)
-    search_fields = ('user__email', 'user__email',)
+    search_fields = ('user__email', 'author__email',)
+    list_select_related = ('user', 'author')
+    autocomplete_fields = ('user', 'author')
+    show_full_result_count = False
     empty_value = settings.EMPTY_VALUE
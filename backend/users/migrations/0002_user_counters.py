@@ -0,0 +1,46 @@
+# Generated by Django 3.2.16 on 2026-10-18 04:51
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def count_by_author(model):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(author=OuterRef('pk')).order_by().values(
+                'author'
+            ).annotate(total=Count('pk')).values('total')
+        ),
+        Value(0),
+    )
+
+
+def fill_counters(apps, schema_editor):
+    User = apps.get_model('users', 'User')
+    User.objects.update(
+        recipes_count=count_by_author(apps.get_model('recipes', 'Recipe')),
+        followers_count=count_by_author(apps.get_model('users', 'Follow')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+        ('recipes', '0006_shopping_list_item'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Число подписчиков'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='recipes_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Число рецептов'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]